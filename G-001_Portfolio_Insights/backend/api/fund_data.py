@@ -1,15 +1,21 @@
-import asyncio
 import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
-from util.eastmoney import get_fund_data_from_api
+from util.columnar import encode_dates, float_column
+from util.json_response import FastJSONResponse
+from util.nav_cache import nav_cache
+from util.portfolio_engine import FundColumns, aggregate, align
+from util.risk_metrics import compute_metrics
 
 router = APIRouter()
 
+RESPONSE_FORMATS = ("rows", "columnar")
+
 
 class PortfolioItem(BaseModel):
     code: str
@@ -22,12 +28,12 @@ class PortfolioRequest(BaseModel):
     end_date: Optional[str] = None
 
 
-@router.get("/api/fund/{code}")
-async def get_fund_data(
-        code: str,
-        start_date: Optional[str] = None,
-        end_date: Optional[str] = None,
-):
+class PortfolioMetricsRequest(PortfolioRequest):
+    periods_per_year: float = 252
+    risk_free_rate: float = 0.0
+
+
+def _resolve_date_range(start_date: Optional[str], end_date: Optional[str]):
     try:
         s_date = datetime.datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
         e_date = datetime.datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
@@ -43,61 +49,27 @@ async def get_fund_data(
         e_date = today
     if s_date > e_date:
         raise HTTPException(status_code=400, detail="Start date cannot be later than end date.")
+    return s_date, e_date
 
-    data_list, error, debug_info = await get_fund_data_from_api(code, s_date, e_date)
 
-    if error:
-        return JSONResponse(status_code=500, content={"error": str(error), "debug_info": debug_info})
-
-    if not data_list:
-        return JSONResponse(status_code=404, content={"error": "No data found", "debug_info": debug_info})
+def _check_format(response_format: str) -> None:
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(RESPONSE_FORMATS)}.")
 
-    processed_data = []
-    for item in data_list:
-        try:
-            val = item.get("DWJZ")
-            if val:
-                processed_data.append(
-                    {
-                        "date": item["FSRQ"],
-                        "value": float(val),
-                        "cumulative_value": float(item.get("LJJZ", 0)),
-                    }
-                )
-        except (ValueError, KeyError):
-            continue
 
-    processed_data.sort(key=lambda x: x["date"])
-
-    return {"fund_code": code, "data": processed_data, "debug_info": debug_info}
-
-
-@router.post("/api/portfolio")
-async def get_portfolio_data(request: PortfolioRequest):
+async def _load_portfolio(request: PortfolioRequest):
     filtered_items = [item for item in request.items if item.code and item.shares and item.shares > 0]
     if not filtered_items:
         raise HTTPException(status_code=400, detail="Portfolio items are required.")
 
-    try:
-        s_date = datetime.datetime.strptime(request.start_date, "%Y-%m-%d").date() if request.start_date else None
-        e_date = datetime.datetime.strptime(request.end_date, "%Y-%m-%d").date() if request.end_date else None
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
-
-    if not s_date:
-        s_date = datetime.date.today() - datetime.timedelta(days=365)
-    if not e_date:
-        e_date = datetime.date.today()
-    today = datetime.date.today()
-    if e_date > today:
-        e_date = today
-    if s_date > e_date:
-        raise HTTPException(status_code=400, detail="Start date cannot be later than end date.")
+    s_date, e_date = _resolve_date_range(request.start_date, request.end_date)
 
-    tasks = [get_fund_data_from_api(item.code, s_date, e_date) for item in filtered_items]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    try:
+        results = await nav_cache.get_many([item.code for item in filtered_items], s_date, e_date, columnar=True)
+    except Exception as e:
+        results = [e] * len(filtered_items)
 
-    fund_series = []
+    fund_columns = []
     debug_info = {}
     errors = []
 
@@ -105,89 +77,191 @@ async def get_portfolio_data(request: PortfolioRequest):
         if isinstance(result, Exception):
             errors.append({"code": item.code, "error": str(result)})
             continue
-        data_list, error, fund_debug = result
+        series, error, fund_debug = result
         debug_info[item.code] = fund_debug
         if error:
             errors.append({"code": item.code, "error": str(error)})
             continue
-        if not data_list:
+        if not series["dates"]:
             errors.append({"code": item.code, "error": "No data found"})
             continue
-        processed = []
-        for entry in data_list:
-            val = entry.get("DWJZ")
-            cumulative_val = entry.get("LJJZ")
-            date_str = entry.get("FSRQ")
-            if not val or not date_str:
-                continue
-            try:
-                value = float(val)
-                cumulative_value = float(cumulative_val) if cumulative_val not in (None, "") else None
-            except ValueError:
-                continue
-            processed.append(
-                {
-                    "date": date_str,
-                    "value": value,
-                    "cumulative_value": cumulative_value,
-                    "amount": value * item.shares,
-                }
-            )
-        processed.sort(key=lambda x: x["date"])
-        fund_series.append({"code": item.code, "shares": item.shares, "data": processed})
+        fund_columns.append(FundColumns(item.code, item.shares, series["dates"], series["values"],
+                                        series["cumulative_values"]))
 
-    if not fund_series and errors:
+    error_response = None
+    if not fund_columns and errors:
         only_no_data = all(error.get("error") == "No data found" for error in errors)
         if only_no_data:
-            return JSONResponse(
+            error_response = JSONResponse(
                 status_code=404,
                 content={"error": "No data found for requested date range", "details": errors,
                          "debug_info": debug_info},
             )
-        return JSONResponse(
-            status_code=502,
-            content={"error": "Portfolio fetch failed", "details": errors, "debug_info": debug_info},
-        )
-
-    date_sets = [set(item["date"] for item in fund["data"]) for fund in fund_series]
-    all_dates = sorted(set.union(*date_sets)) if date_sets else []
-    if not all_dates:
+        else:
+            error_response = JSONResponse(
+                status_code=502,
+                content={"error": "Portfolio fetch failed", "details": errors, "debug_info": debug_info},
+            )
+    return s_date, e_date, fund_columns, debug_info, errors, error_response
+
+
+@router.get("/api/fund/{code}")
+async def get_fund_data(
+        code: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        response_format: str = Query("rows", alias="format"),
+        debug: bool = True,
+):
+    _check_format(response_format)
+    s_date, e_date = _resolve_date_range(start_date, end_date)
+
+    columnar = response_format == "columnar"
+    series, error, debug_info = await nav_cache.get_series(code, s_date, e_date, columnar=columnar)
+
+    if error:
+        return JSONResponse(status_code=500, content={"error": str(error), "debug_info": debug_info})
+
+    if not (series["dates"] if columnar else series):
+        return JSONResponse(status_code=404, content={"error": "No data found", "debug_info": debug_info})
+
+    if columnar:
+        cumulative = float_column(series["cumulative_values"])
+        keep = ~np.isnan(cumulative)
+        dates = np.asarray(series["dates"], dtype="datetime64[D]")[keep]
+        payload = {
+            "fund_code": code,
+            "format": "columnar",
+            "dates": encode_dates(dates),
+            "value": np.asarray(series["values"], dtype=np.float64)[keep],
+            "cumulative_value": cumulative[keep],
+        }
+    else:
+        processed_data = [entry for entry in series if entry["cumulative_value"] is not None]
+        payload = {"fund_code": code, "data": processed_data}
+    if debug:
+        payload["debug_info"] = debug_info
+    return FastJSONResponse(content=payload)
+
+
+@router.post("/api/portfolio")
+async def get_portfolio_data(
+        request: PortfolioRequest,
+        response_format: str = Query("rows", alias="format"),
+        debug: bool = True,
+):
+    _check_format(response_format)
+    s_date, e_date, fund_columns, debug_info, errors, error_response = await _load_portfolio(request)
+    if error_response is not None:
+        return error_response
+
+    frame = align(fund_columns)
+    if not len(frame.dates):
         return JSONResponse(status_code=404,
                             content={"error": "No dates found", "debug_info": debug_info, "details": errors})
 
-    fund_value_maps = {fund["code"]: {entry["date"]: entry for entry in fund["data"]} for fund in fund_series}
-
-    portfolio_series = []
-    for date_str in all_dates:
-        total_value = 0.0
-        performance_value = 0.0
-        for fund in fund_series:
-            entry = fund_value_maps[fund["code"]].get(date_str)
-            if entry:
-                total_value += entry["amount"]
-                if entry["cumulative_value"] is not None:
-                    performance_value += entry["cumulative_value"] * fund["shares"]
-        portfolio_series.append(
-            {"date": date_str, "total_value": total_value, "performance_value": performance_value}
-        )
-
-    base_value = portfolio_series[0]["performance_value"] if portfolio_series else 0.0
-    base_total_value = portfolio_series[0]["total_value"] if portfolio_series else 0.0
-    for entry in portfolio_series:
-        entry["normalized_value"] = entry["performance_value"] / base_value if base_value else 0.0
-        entry["normalized_total_value"] = entry["total_value"] / base_total_value if base_total_value else 0.0
+    totals = aggregate(frame)
+    if response_format == "columnar":
+        portfolio = {
+            "dates": encode_dates(frame.dates),
+            "total_value": totals["total_value"],
+            "performance_value": totals["performance_value"],
+            "normalized_value": totals["normalized_value"],
+            "normalized_total_value": totals["normalized_total_value"],
+        }
+        fund_series = []
+        for col, fund in enumerate(frame.codes):
+            present = ~np.isnan(frame.nav[:, col])
+            fund_series.append({
+                "code": fund,
+                "shares": float(frame.shares[col]),
+                "dates": encode_dates(frame.dates[present]),
+                "value": frame.nav[present, col],
+                "cumulative_value": frame.cumulative[present, col],
+                "amount": frame.nav[present, col] * frame.shares[col],
+            })
+    else:
+        portfolio = {
+            "data": [
+                {
+                    "date": date_str,
+                    "total_value": total_value,
+                    "performance_value": performance_value,
+                    "normalized_value": normalized_value,
+                    "normalized_total_value": normalized_total_value,
+                }
+                for date_str, total_value, performance_value, normalized_value, normalized_total_value in zip(
+                    frame.date_strings,
+                    totals["total_value"].tolist(),
+                    totals["performance_value"].tolist(),
+                    totals["normalized_value"].tolist(),
+                    totals["normalized_total_value"].tolist(),
+                )
+            ],
+        }
+        fund_series = [
+            {
+                "code": fund.code,
+                "shares": fund.shares,
+                "data": [
+                    {"date": d, "value": v, "cumulative_value": c, "amount": v * fund.shares}
+                    for d, v, c in zip(fund.dates, fund.values, fund.cumulative_values)
+                ],
+            }
+            for fund in fund_columns
+        ]
 
     response_payload = {
         "portfolio": {
             "start_date": s_date.strftime("%Y-%m-%d"),
             "end_date": e_date.strftime("%Y-%m-%d"),
-            "base_value": base_value,
-            "base_total_value": base_total_value,
-            "data": portfolio_series,
+            "base_value": totals["base_value"],
+            "base_total_value": totals["base_total_value"],
+            **portfolio,
         },
         "funds": fund_series,
-        "debug_info": debug_info,
+    }
+    if response_format == "columnar":
+        response_payload["format"] = "columnar"
+    if debug:
+        response_payload["debug_info"] = debug_info
+    if errors:
+        response_payload["warnings"] = errors
+    return FastJSONResponse(content=response_payload)
+
+
+@router.post("/api/portfolio/metrics")
+async def get_portfolio_metrics(request: PortfolioMetricsRequest):
+    if request.periods_per_year <= 0:
+        raise HTTPException(status_code=400, detail="periods_per_year must be positive.")
+
+    s_date, e_date, fund_columns, debug_info, errors, error_response = await _load_portfolio(request)
+    if error_response is not None:
+        return error_response
+
+    frame = align(fund_columns)
+    if not len(frame.dates):
+        return JSONResponse(status_code=404,
+                            content={"error": "No dates found", "debug_info": debug_info, "details": errors})
+
+    totals = aggregate(frame)
+    # Columns: portfolio performance (LJJZ based), portfolio holdings (DWJZ based), then each fund's LJJZ.
+    matrix = np.column_stack([totals["performance_value"], totals["total_value"], frame.cumulative])
+    metrics = compute_metrics(
+        matrix,
+        frame.dates,
+        periods_per_year=request.periods_per_year,
+        risk_free_rate=request.risk_free_rate,
+    )
+
+    response_payload = {
+        "start_date": s_date.strftime("%Y-%m-%d"),
+        "end_date": e_date.strftime("%Y-%m-%d"),
+        "periods_per_year": request.periods_per_year,
+        "risk_free_rate": request.risk_free_rate,
+        "portfolio": {"performance": metrics[0], "total": metrics[1]},
+        "funds": {code: fund_metrics for code, fund_metrics in zip(frame.codes, metrics[2:])},
     }
     if errors:
         response_payload["warnings"] = errors
-    return response_payload
+    return FastJSONResponse(content=response_payload)
@@ -1,11 +1,10 @@
-import asyncio
 from typing import List
 
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
-from util.eastmoney import get_fund_name_from_api
+from util.fund_name_store import fund_name_store
 
 router = APIRouter()
 
@@ -17,7 +16,7 @@ class FundNameBatchRequest(BaseModel):
 @router.get("/api/fund-name/{code}")
 async def get_fund_name(code: str):
     cache_headers = {"Cache-Control": "public, max-age=86400"}
-    fund_name, error, debug_info = await get_fund_name_from_api(code)
+    fund_name, error, debug_info = await fund_name_store.lookup(code)
     if error:
         return JSONResponse(status_code=500, content={"error": str(error), "debug_info": debug_info})
     if not fund_name:
@@ -34,8 +33,7 @@ async def get_fund_name_batch(request: FundNameBatchRequest):
     codes = [code for code in request.codes if code]
     if not codes:
         raise HTTPException(status_code=400, detail="Codes are required.")
-    tasks = [get_fund_name_from_api(code) for code in codes]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    results = await fund_name_store.lookup_many(codes)
     names = {}
     errors = []
     debug_info = {}
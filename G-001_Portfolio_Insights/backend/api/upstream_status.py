@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+
+from util.eastmoney import fund_data_flight, page_size_negotiator
+from util.fund_name_store import fund_name_store
+from util.nav_cache import nav_cache
+from util.upstream_scheduler import upstream_scheduler
+
+router = APIRouter()
+
+
+@router.get("/api/upstream/stats")
+async def get_upstream_stats():
+    return {
+        "scheduler": upstream_scheduler.stats(),
+        "single_flight": fund_data_flight.stats(),
+        "nav_page_size": page_size_negotiator.page_size,
+        "nav_cache": nav_cache.stats(),
+        "fund_name_store": fund_name_store.stats(),
+    }
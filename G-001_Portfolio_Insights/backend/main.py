@@ -1,13 +1,35 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 
 from api.fund_data import router as fund_router
 from api.fund_info import router as fund_name_router
+from api.upstream_status import router as upstream_status_router
+from util.fund_name_store import fund_name_store
+from util.http_client import close_http_client, init_http_client
+from util.nav_cache import nav_cache
+from util.upstream_scheduler import new_flow, upstream_flow
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    await init_http_client()
+    fund_name_store.load()
+    warm_task = asyncio.create_task(fund_name_store.keep_warm())
+    try:
+        yield
+    finally:
+        warm_task.cancel()
+        await nav_cache.source.close()
+        await close_http_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware to allow requests from any origin (useful for development)
 app.add_middleware(
@@ -17,9 +39,22 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+
+@app.middleware("http")
+async def assign_upstream_flow(request: Request, call_next):
+    # Each inbound request gets its own flow so the upstream scheduler can queue fairly between them.
+    token = new_flow()
+    try:
+        return await call_next(request)
+    finally:
+        upstream_flow.reset(token)
+
 
 app.include_router(fund_router)
 app.include_router(fund_name_router)
+app.include_router(upstream_status_router)
 frontend_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend-vue", "dist")
 
 if os.path.exists(frontend_path):
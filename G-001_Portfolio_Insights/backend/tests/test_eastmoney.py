@@ -0,0 +1,55 @@
+import asyncio
+import datetime
+
+import httpx
+
+from util import eastmoney
+from util.eastmoney import PageSizeNegotiator
+
+
+def test_negotiator_probes_full_size_again(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(eastmoney.time, "monotonic", lambda: now[0])
+    negotiator = PageSizeNegotiator(initial=1000, fallback=20, probe_interval=60)
+    negotiator.on_rejected(1000)
+    assert negotiator.next_size() == 500
+    now[0] += 61
+    assert negotiator.next_size() == 1000
+
+
+def _run(monkeypatch, handler):
+    negotiator = PageSizeNegotiator(initial=1000, fallback=20, probe_interval=600)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(eastmoney, "page_size_negotiator", negotiator)
+    monkeypatch.setattr(eastmoney, "get_http_client", lambda: client)
+    d = datetime.date
+    result = asyncio.run(eastmoney._get_fund_data_from_api("000001", d(2024, 1, 1), d(2024, 1, 5)))
+    return result, negotiator
+
+
+def _page(err_code=0):
+    return {"ErrCode": err_code, "ErrMsg": "bad", "TotalCount": 1,
+            "Data": {"LSJZList": [{"FSRQ": "2024-01-02", "DWJZ": "1.0", "LJJZ": "1.0"}]}}
+
+
+def test_fund_error_does_not_lower_page_size(monkeypatch):
+    (data, error, _), negotiator = _run(monkeypatch, lambda request: httpx.Response(200, json=_page(err_code=-999)))
+    assert data is None and error
+    assert negotiator.page_size == 1000
+
+
+def test_throttling_does_not_lower_page_size(monkeypatch):
+    (data, error, _), negotiator = _run(monkeypatch, lambda request: httpx.Response(429))
+    assert data is None and error
+    assert negotiator.page_size == 1000
+
+
+def test_confirmed_rejection_lowers_page_size(monkeypatch):
+    def handler(request):
+        if int(request.url.params["pageSize"]) > 20:
+            return httpx.Response(200, json=_page(err_code=-1))
+        return httpx.Response(200, json=_page())
+
+    (data, error, _), negotiator = _run(monkeypatch, handler)
+    assert error is None and len(data) == 1
+    assert negotiator.page_size == 500
@@ -0,0 +1,22 @@
+import asyncio
+import json
+
+from util.fund_name_store import FundNameStore
+
+
+def test_concurrent_saves_persist_every_name(tmp_path):
+    path = tmp_path / "fund_names.json"
+    store = FundNameStore(str(path), ttl=86400)
+
+    async def add_and_save(code):
+        store.names[code] = f"fund {code}"
+        store._dirty = True
+        await store.save()
+
+    async def main():
+        await asyncio.gather(*(add_and_save(f"{i:06d}") for i in range(50)))
+
+    asyncio.run(main())
+    assert len(json.loads(path.read_text(encoding="utf-8"))["names"]) == 50
+    assert [p.name for p in tmp_path.iterdir()] == ["fund_names.json"]
+    assert not store._dirty
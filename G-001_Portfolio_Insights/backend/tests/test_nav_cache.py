@@ -0,0 +1,50 @@
+import asyncio
+import datetime
+
+from util.nav_cache import NavCache
+from util.nav_source import RangeResult
+
+
+class FakeSource:
+    name = "fake"
+
+    def __init__(self):
+        self.requests = []
+
+    async def fetch_ranges(self, requests):
+        self.requests.extend(requests)
+        results = []
+        for _, s, e in requests:
+            rows = []
+            d = s
+            while d <= e:
+                rows.append((d.isoformat(), 1.0, 1.0))
+                d += datetime.timedelta(days=1)
+            results.append(RangeResult(rows, None, {}))
+        return results
+
+
+def test_disjoint_fetch_does_not_hide_gap():
+    source = FakeSource()
+    cache = NavCache(source, max_bytes=1 << 20, settle_days=0, tail_ttl=300.0)
+    d = datetime.date
+    asyncio.run(cache.get_series("000001", d(2024, 1, 1), d(2024, 1, 10)))
+    asyncio.run(cache.get_series("000001", d(2024, 3, 1), d(2024, 3, 31)))
+    source.requests.clear()
+    rows, error, _ = asyncio.run(cache.get_series("000001", d(2024, 1, 1), d(2024, 3, 31)))
+    assert error is None
+    assert ("000001", d(2024, 1, 11), d(2024, 3, 31)) in source.requests
+    assert len(rows) == (d(2024, 3, 31) - d(2024, 1, 1)).days + 1
+
+
+def test_earlier_disjoint_fetch_does_not_hide_gap():
+    source = FakeSource()
+    cache = NavCache(source, max_bytes=1 << 20, settle_days=0, tail_ttl=300.0)
+    d = datetime.date
+    asyncio.run(cache.get_series("000001", d(2024, 3, 1), d(2024, 3, 31)))
+    asyncio.run(cache.get_series("000001", d(2024, 1, 1), d(2024, 1, 10)))
+    source.requests.clear()
+    rows, error, debug_info = asyncio.run(cache.get_series("000001", d(2024, 2, 1), d(2024, 2, 29)))
+    assert error is None
+    assert debug_info["cache"] != "hit"
+    assert len(rows) == 29
@@ -0,0 +1,15 @@
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+def encode_dates(dates) -> dict:
+    """Encode a sorted date axis as a start date plus day offsets."""
+    axis = np.asarray(dates, dtype="datetime64[D]")
+    if not len(axis):
+        return {"start": None, "offsets": []}
+    return {"start": str(axis[0]), "offsets": (axis - axis[0]).astype(np.int32)}
+
+
+def float_column(values: Sequence[Optional[float]]) -> np.ndarray:
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
@@ -1,16 +1,80 @@
 import asyncio
 import datetime
+import json
 import math
-from typing import Dict
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
 
 import httpx
 
+from util.http_client import get_http_client
+from util.singleflight import SingleFlight
+from util.upstream_scheduler import upstream_scheduler
+
+fund_data_flight = SingleFlight()
+
+NAV_BASE_URL = "https://api.fund.eastmoney.com/f10/lsjz"
+DEFAULT_PAGE_SIZE = 20
+
+RANK_URL = "http://fund.eastmoney.com/data/rankhandler.aspx?op=ph&dt=kf&ft={ft}&rs=&gs=0&sc=zzf&st=desc&pi=1&pn=30000&dx=1"
+RANK_FUND_TYPES = ["gp", "hh", "zq", "zs", "qdii", "lof", "fof"]
+
+
+class PageSizeNegotiator:
+    """Tracks the largest lsjz page size the upstream honours, shared by every crawl in the process."""
+
+    def __init__(self, initial: int, fallback: int, probe_interval: float):
+        self.fallback = fallback
+        self.ceiling = max(initial, fallback)
+        self.page_size = self.ceiling
+        self.probe_interval = probe_interval
+        self._lowered_at = 0.0
+
+    def next_size(self) -> int:
+        """Page size for the next crawl; after probe_interval at a lowered size, try the full size again."""
+        if self.page_size < self.ceiling and time.monotonic() - self._lowered_at >= self.probe_interval:
+            self.page_size = self.ceiling
+        return self.page_size
+
+    def _lower(self, size: int) -> None:
+        self.page_size = max(min(self.page_size, size), self.fallback)
+        self._lowered_at = time.monotonic()
+
+    def on_capped(self, served: int) -> None:
+        self._lower(served)
+
+    def on_rejected(self, rejected_size: int) -> None:
+        self._lower(rejected_size // 2)
+
+
+page_size_negotiator = PageSizeNegotiator(
+    initial=int(os.environ.get("NAV_MAX_PAGE_SIZE", 1000)),
+    fallback=DEFAULT_PAGE_SIZE,
+    probe_interval=float(os.environ.get("NAV_PAGE_SIZE_PROBE_INTERVAL", 600)),
+)
+
+
+def _estimate_rows(start_date: Optional[datetime.date], end_date: Optional[datetime.date]) -> Optional[int]:
+    if not start_date or not end_date or start_date > end_date:
+        return None
+    days = (end_date - start_date).days + 1
+    full_weeks, remainder = divmod(days, 7)
+    weekdays = full_weeks * 5 + sum(1 for i in range(remainder) if (start_date.weekday() + i) % 7 < 5)
+    return weekdays
+
+
+def _estimate_pages(start_date: Optional[datetime.date], end_date: Optional[datetime.date], page_size: int) -> int:
+    rows = _estimate_rows(start_date, end_date)
+    if not rows:
+        return 1
+    return max(1, math.ceil(rows / page_size))
+
 
 async def _fetch_page(
         client: httpx.AsyncClient,
-        semaphore: asyncio.Semaphore,
         base_url: str,
-        headers: Dict[str, str],
         code: str,
         page: int,
         page_size: int,
@@ -24,124 +88,209 @@ async def _fetch_page(
         "startDate": s_date,
         "endDate": e_date,
     }
-    async with semaphore:
-        response = await client.get(base_url, params=params, headers=headers)
+    async with upstream_scheduler.slot():
+        response = await client.get(base_url, params=params)
         response.raise_for_status()
         try:
             data = response.json()
         except ValueError as e:
             raise ValueError(f"响应数据不是有效的JSON: {e}")
-        err_code = data.get("ErrCode")
-        if err_code is not None and err_code != 0:
-            err_msg = data.get("ErrMsg", "未知错误")
-            raise ValueError(f"API返回错误 (第{page}页): {err_msg} (错误码: {err_code})")
-        return data
+        return response, data
+
+
+def _page_error(data: dict, page: int) -> Optional[str]:
+    err_code = data.get("ErrCode")
+    if err_code is not None and err_code != 0:
+        return f"API返回错误 (第{page}页): {data.get('ErrMsg', '未知错误')} (错误码: {err_code})"
+    return None
+
+
+def _may_reject_page_size(result) -> bool:
+    """Whether a first-page result could be the upstream refusing the page size (as opposed to throttling,
+    a server fault, an unknown fund or garbage in the body)."""
+    if isinstance(result, httpx.HTTPStatusError):
+        return result.response.status_code in (400, 413)
+    if isinstance(result, Exception):
+        return False
+    err_code = result[1].get("ErrCode")
+    return err_code is not None and err_code != 0
+
+
+def _page_items(data: dict) -> List[dict]:
+    return (data.get("Data") or {}).get("LSJZList") or []
 
 
 async def get_fund_data_from_api(code: str, start_date: datetime.date, end_date: datetime.date):
-    base_url = "https://api.fund.eastmoney.com/f10/lsjz"
-    page_size = 20
-    headers = {
-        "Referer": "https://fund.eastmoney.com/",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    }
+    return await fund_data_flight.do((code, start_date, end_date), _get_fund_data_from_api, code, start_date, end_date)
+
 
+async def _get_fund_data_from_api(code: str, start_date: datetime.date, end_date: datetime.date):
     s_date = start_date.strftime("%Y-%m-%d") if start_date else ""
     e_date = end_date.strftime("%Y-%m-%d") if end_date else ""
 
     debug_info = {}
+    client = get_http_client()
+    page_size = page_size_negotiator.next_size()
+    suspected_size = None
 
-    async with httpx.AsyncClient(timeout=10.0, headers=headers) as client:
-        try:
-            first_params = {
-                "fundCode": code,
-                "pageIndex": 1,
-                "pageSize": page_size,
-                "startDate": s_date,
-                "endDate": e_date,
-            }
-            first_response = await client.get(base_url, params=first_params)
-            first_response.raise_for_status()
-            try:
-                first_data = first_response.json()
-            except ValueError as e:
-                return None, f"响应数据不是有效的JSON: {e}", {"url": str(first_response.url)}
+    def fetch(page: int, size: int):
+        return _fetch_page(client, NAV_BASE_URL, code, page, size, s_date, e_date)
+
+    try:
+        while True:
+            # Guess the page count from the date range so all pages go out at once instead of page 1 first.
+            estimated_pages = _estimate_pages(start_date, end_date, page_size)
+            results = await asyncio.gather(*[fetch(page, page_size) for page in range(1, estimated_pages + 1)],
+                                           return_exceptions=True)
+            first = results[0]
+            if page_size > DEFAULT_PAGE_SIZE and _may_reject_page_size(first):
+                # Only blame the page size if the same request goes through at the fallback size.
+                suspected_size = page_size
+                page_size = DEFAULT_PAGE_SIZE
+                continue
+            if isinstance(first, Exception):
+                if isinstance(first, httpx.HTTPError):
+                    raise first
+                return None, str(first), debug_info
 
+            first_response, first_data = first
             err_code = first_data.get("ErrCode")
             err_msg = first_data.get("ErrMsg", "")
             debug_info = {
                 "url": str(first_response.url),
-                "params": first_params,
+                "params": dict(first_response.request.url.params),
                 "status_code": first_response.status_code,
                 "err_code": err_code,
                 "err_msg": err_msg,
+                "page_size": page_size,
             }
-
             if err_code is not None and err_code != 0:
                 return None, f"API返回错误: {err_msg} (错误码: {err_code})", debug_info
+            if suspected_size is not None:
+                page_size_negotiator.on_rejected(suspected_size)
+            break
+
+        total_count = first_data.get("TotalCount", 0)
+        if total_count == 0:
+            return [], None, debug_info
+
+        served = len(_page_items(first_data))
+        if 0 < served < min(page_size, total_count):
+            # The upstream silently capped the page; the other pages were cut with the wrong size.
+            page_size_negotiator.on_capped(served)
+            page_size = served
+            results = results[:1]
+        total_pages = math.ceil(total_count / page_size)
+        if total_pages > len(results):
+            results += await asyncio.gather(
+                *[fetch(page, page_size) for page in range(len(results) + 1, total_pages + 1)],
+                return_exceptions=True,
+            )
+        debug_info["page_size"] = page_size
+        debug_info["pages"] = len(results)
+
+        all_data = []
+        seen_dates = set()
+        page_errors = []
+        for page, result in enumerate(results, start=1):
+            if isinstance(result, Exception):
+                page_errors.append(str(result))
+                continue
+            error = _page_error(result[1], page)
+            if error:
+                page_errors.append(error)
+                continue
+            for item in _page_items(result[1]):
+                if item.get("FSRQ") not in seen_dates:
+                    seen_dates.add(item.get("FSRQ"))
+                    all_data.append(item)
+        if page_errors:
+            debug_info["page_errors"] = page_errors
 
-            total_count = first_data.get("TotalCount", 0)
-            if total_count == 0:
-                return [], None, debug_info
-
-            total_pages = math.ceil(total_count / page_size) if total_count else 0
-            all_data = []
-            all_data.extend(first_data.get("Data", {}).get("LSJZList") or [])
-
-            if total_pages > 1:
-                semaphore = asyncio.Semaphore(20)
-                tasks = [
-                    _fetch_page(client, semaphore, base_url, headers, code, page, page_size, s_date, e_date)
-                    for page in range(2, total_pages + 1)
-                ]
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                page_errors = []
-                for result in results:
-                    if isinstance(result, Exception):
-                        page_errors.append(str(result))
-                        continue
-                    all_data.extend(result.get("Data", {}).get("LSJZList") or [])
-                if page_errors:
-                    debug_info["page_errors"] = page_errors
-
-            if not all_data:
-                return None, "No data found.", debug_info
-
-            return all_data, None, debug_info
-        except httpx.HTTPError as e:
-            return None, f"网络请求失败: {e}", debug_info
+        if not all_data:
+            return None, "No data found.", debug_info
+
+        return all_data, None, debug_info
+    except httpx.HTTPError as e:
+        return None, f"网络请求失败: {e}", debug_info
+
+
+def fund_name_search_url(code: str) -> str:
+    return f"https://fundsuggest.eastmoney.com/FundSearch/api/FundSearchAPI.ashx?m=1&key={code}"
 
 
 async def get_fund_name_from_api(code: str):
-    url = f"https://fundsuggest.eastmoney.com/FundSearch/api/FundSearchAPI.ashx?m=1&key={code}"
-    headers = {
-        "Referer": "https://fund.eastmoney.com/",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    }
-    async with httpx.AsyncClient(timeout=20.0, headers=headers) as client:
+    url = fund_name_search_url(code)
+    client = get_http_client()
+    try:
+        async with upstream_scheduler.slot():
+            response = await client.get(url, timeout=20.0)
+        response.raise_for_status()
         try:
-            response = await client.get(url)
-            response.raise_for_status()
-            try:
-                payload = response.json()
-            except ValueError as e:
-                return None, f"响应数据不是有效的JSON: {e}", {"url": str(response.url)}
-            err_code = payload.get("ErrCode")
-            err_msg = payload.get("ErrMsg", "")
-            debug_info = {
-                "url": str(response.url),
-                "status_code": response.status_code,
-                "err_code": err_code,
-                "err_msg": err_msg,
-            }
-            if err_code is not None and err_code != 0:
-                return None, f"API返回错误: {err_msg} (错误码: {err_code})", debug_info
-            records = payload.get("Datas") or []
-            target = next(
-                (item for item in records if str(item.get("CATEGORY")) == "700"),
-                None
-            )
-            fund_name = target.get("NAME") if target else None
-            return fund_name, None, debug_info
-        except httpx.HTTPError as e:
-            return None, f"网络请求失败: {e}", {"url": url}
+            payload = response.json()
+        except ValueError as e:
+            return None, f"响应数据不是有效的JSON: {e}", {"url": str(response.url)}
+        err_code = payload.get("ErrCode")
+        err_msg = payload.get("ErrMsg", "")
+        debug_info = {
+            "url": str(response.url),
+            "status_code": response.status_code,
+            "err_code": err_code,
+            "err_msg": err_msg,
+        }
+        if err_code is not None and err_code != 0:
+            return None, f"API返回错误: {err_msg} (错误码: {err_code})", debug_info
+        records = payload.get("Datas") or []
+        target = next(
+            (item for item in records if str(item.get("CATEGORY")) == "700"),
+            None
+        )
+        fund_name = target.get("NAME") if target else None
+        return fund_name, None, debug_info
+    except httpx.HTTPError as e:
+        return None, f"网络请求失败: {e}", {"url": url}
+
+
+def _pick_name(fields: List[str]) -> str:
+    if len(fields) < 2:
+        return ""
+    for i in range(1, min(len(fields), 6)):
+        if re.search(r"[\u4e00-\u9fa5]", fields[i]):
+            return fields[i]
+    return fields[1]
+
+
+async def _fetch_rank_pairs(client: httpx.AsyncClient, ft: str) -> List[Tuple[str, str]]:
+    async with upstream_scheduler.slot():
+        response = await client.get(RANK_URL.format(ft=ft), timeout=30.0)
+    response.raise_for_status()
+    m = re.search(r"datas:\[(.*?)\]", response.text, re.DOTALL)
+    if not m:
+        return []
+    try:
+        items = json.loads(f"[{m.group(1)}]")
+    except json.JSONDecodeError:
+        items = re.findall(r'"(.*?)"', m.group(1))
+    pairs = []
+    for item in items:
+        parts = item.split(",")
+        code = parts[0]
+        name = _pick_name(parts)
+        if code and name:
+            pairs.append((code, name))
+    return pairs
+
+
+async def get_all_fund_names_from_api() -> Dict[str, str]:
+    client = get_http_client()
+    results = await asyncio.gather(*(_fetch_rank_pairs(client, ft) for ft in RANK_FUND_TYPES), return_exceptions=True)
+    names: Dict[str, str] = {}
+    for result in results:
+        if isinstance(result, Exception):
+            continue
+        for code, name in result:
+            names.setdefault(code, name)
+    if not names:
+        for code, name in await _fetch_rank_pairs(client, "all"):
+            names.setdefault(code, name)
+    return names
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from util.eastmoney import fund_name_search_url, get_all_fund_names_from_api, get_fund_name_from_api
+from util.singleflight import SingleFlight
+
+logger = logging.getLogger("uvicorn.error")
+
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "fund_names.json")
+
+
+class FundNameStore:
+    """Fund code -> name index held in memory and persisted as a JSON file."""
+
+    def __init__(self, path: str, ttl: float, check_interval: float = 600.0):
+        self.path = path
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.names: Dict[str, str] = {}
+        self.warmed_at = 0.0
+        self._flight = SingleFlight()
+        self._dirty = False
+        self._save_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load fund name store {self.path}: {e}")
+            return
+        self.names = payload.get("names") or {}
+        self.warmed_at = float(payload.get("warmed_at") or 0.0)
+
+    def _write(self, payload: dict) -> None:
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    async def save(self) -> None:
+        async with self._save_lock:
+            if not self._dirty:
+                return
+            # Cleared before the snapshot so names added during the write mark the store dirty again.
+            self._dirty = False
+            payload = {"warmed_at": self.warmed_at, "names": dict(self.names)}
+            try:
+                await asyncio.to_thread(self._write, payload)
+            except OSError as e:
+                self._dirty = True
+                logger.warning(f"Failed to persist fund name store {self.path}: {e}")
+
+    @property
+    def stale(self) -> bool:
+        return not self.names or time.time() - self.warmed_at > self.ttl
+
+    async def warm(self) -> int:
+        names = await get_all_fund_names_from_api()
+        if not names:
+            return 0
+        self.names.update(names)
+        self.warmed_at = time.time()
+        self._dirty = True
+        await self.save()
+        logger.info(f"Fund name store warmed with {len(names)} names")
+        return len(names)
+
+    async def warm_if_stale(self) -> None:
+        if not self.stale:
+            return
+        try:
+            await self.warm()
+        except Exception as e:
+            logger.warning(f"Failed to warm fund name store: {e}")
+
+    async def keep_warm(self) -> None:
+        """Re-warm whenever the store goes stale, for as long as the app runs."""
+        while True:
+            await self.warm_if_stale()
+            await asyncio.sleep(self.check_interval)
+
+    async def _lookup_upstream(self, code: str):
+        fund_name, error, debug_info = await get_fund_name_from_api(code)
+        if fund_name:
+            self.names[code] = fund_name
+            self._dirty = True
+        return fund_name, error, debug_info
+
+    async def lookup(self, code: str, persist: bool = True):
+        fund_name = self.names.get(code)
+        if fund_name:
+            self.hits += 1
+            return fund_name, None, {"url": fund_name_search_url(code), "source": "store"}
+        self.misses += 1
+        result = await self._flight.do(code, self._lookup_upstream, code)
+        if persist:
+            await self.save()
+        return result
+
+    async def lookup_many(self, codes: List[str]):
+        results = await asyncio.gather(*(self.lookup(code, persist=False) for code in codes), return_exceptions=True)
+        await self.save()
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "names": len(self.names),
+            "warmed_at": self.warmed_at,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+fund_name_store = FundNameStore(
+    path=os.environ.get("FUND_NAME_STORE_PATH", DEFAULT_STORE_PATH),
+    ttl=float(os.environ.get("FUND_NAME_STORE_TTL", 86400)),
+    check_interval=float(os.environ.get("FUND_NAME_STORE_CHECK_INTERVAL", 600)),
+)
@@ -0,0 +1,190 @@
+import bisect
+import datetime
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from util.nav_source import build_nav_source
+
+# Rough per-row footprint of the three parallel lists (date str + two floats + list slots).
+_ROW_BYTES = 136
+_ENTRY_OVERHEAD = 512
+_ONE_DAY = datetime.timedelta(days=1)
+
+
+class NavSeries:
+    __slots__ = ("dates", "values", "cumulative_values", "covered_start", "covered_end",
+                 "tail_checked_end", "tail_checked_at")
+
+    def __init__(self, covered_start: datetime.date):
+        self.dates: List[str] = []
+        self.values: List[float] = []
+        self.cumulative_values: List[Optional[float]] = []
+        self.covered_start = covered_start
+        self.covered_end = covered_start - _ONE_DAY
+        self.tail_checked_end = self.covered_end
+        self.tail_checked_at = 0.0
+
+    @property
+    def nbytes(self) -> int:
+        return _ENTRY_OVERHEAD + len(self.dates) * _ROW_BYTES
+
+    def merge(self, rows: List[Tuple[str, float, Optional[float]]]) -> None:
+        if not rows:
+            return
+        merged = dict(zip(self.dates, zip(self.values, self.cumulative_values)))
+        for date_str, value, cumulative_value in rows:
+            merged[date_str] = (value, cumulative_value)
+        ordered = sorted(merged.items())
+        self.dates = [d for d, _ in ordered]
+        self.values = [v[0] for _, v in ordered]
+        self.cumulative_values = [v[1] for _, v in ordered]
+
+    def _bounds(self, start_date: datetime.date, end_date: datetime.date) -> Tuple[int, int]:
+        return (bisect.bisect_left(self.dates, start_date.isoformat()),
+                bisect.bisect_right(self.dates, end_date.isoformat()))
+
+    def columns(self, start_date: datetime.date, end_date: datetime.date) -> dict:
+        lo, hi = self._bounds(start_date, end_date)
+        return {
+            "dates": self.dates[lo:hi],
+            "values": self.values[lo:hi],
+            "cumulative_values": self.cumulative_values[lo:hi],
+        }
+
+    def slice(self, start_date: datetime.date, end_date: datetime.date, columnar: bool = False):
+        if columnar:
+            return self.columns(start_date, end_date)
+        lo, hi = self._bounds(start_date, end_date)
+        return [
+            {"date": self.dates[i], "value": self.values[i], "cumulative_value": self.cumulative_values[i]}
+            for i in range(lo, hi)
+        ]
+
+    def missing_ranges(self, start_date: datetime.date, end_date: datetime.date,
+                       tail_ttl: float) -> List[Tuple[datetime.date, datetime.date]]:
+        known_end = self.covered_end
+        if time.monotonic() - self.tail_checked_at < tail_ttl:
+            known_end = max(known_end, self.tail_checked_end)
+        ranges = []
+        if start_date < self.covered_start:
+            ranges.append((start_date, min(end_date, self.covered_start - _ONE_DAY)))
+        if end_date > known_end:
+            tail_start = max(start_date, known_end + _ONE_DAY)
+            if ranges and ranges[-1][1] + _ONE_DAY >= tail_start:
+                ranges[-1] = (ranges[-1][0], end_date)
+            else:
+                ranges.append((tail_start, end_date))
+        return ranges
+
+
+class NavCache:
+    """Per-fund NAV series kept in memory, bounded by an approximate byte budget (LRU)."""
+
+    def __init__(self, source, max_bytes: int, settle_days: int = 3, tail_ttl: float = 300.0):
+        self.source = source
+        self.max_bytes = max_bytes
+        self.settle_days = settle_days
+        self.tail_ttl = tail_ttl
+        self._entries: "OrderedDict[str, NavSeries]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _touch(self, code: str) -> Optional[NavSeries]:
+        series = self._entries.get(code)
+        if series is not None:
+            self._entries.move_to_end(code)
+        return series
+
+    def _store(self, code: str, series: NavSeries) -> None:
+        self._entries.pop(code, None)
+        self._bytes -= self._sizes.pop(code, 0)
+        self._entries[code] = series
+        self._sizes[code] = series.nbytes
+        self._bytes += self._sizes[code]
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            evicted_code, _ = self._entries.popitem(last=False)
+            self._bytes -= self._sizes.pop(evicted_code)
+
+    def stats(self) -> dict:
+        return {
+            "source": self.source.name,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _apply(self, series: NavSeries, s: datetime.date, e: datetime.date, result) -> None:
+        series.merge(result.rows)
+        if not result.complete:
+            # Part of the range may be missing, so keep the rows but do not mark the range as covered.
+            return
+        if s < series.covered_start and e + _ONE_DAY >= series.covered_start:
+            series.covered_start = s
+        if s > series.covered_end + _ONE_DAY:
+            # Disjoint from the covered range: the gap in between is still unknown.
+            return
+        if e >= series.tail_checked_end:
+            series.tail_checked_end = e
+            series.tail_checked_at = time.monotonic()
+        covered = min(e, datetime.date.today() - datetime.timedelta(days=self.settle_days))
+        if series.dates:
+            covered = max(covered, min(e, datetime.date.fromisoformat(series.dates[-1])))
+        series.covered_end = max(series.covered_end, covered)
+
+    async def get_many(self, codes: List[str], start_date: datetime.date, end_date: datetime.date,
+                       columnar: bool = False) -> List[tuple]:
+        """Serve several funds at once; all missing ranges go to the source in a single batch."""
+        unique_codes = list(dict.fromkeys(codes))
+        plans = {}
+        requests = []
+        for code in unique_codes:
+            series = self._touch(code)
+            if series is None:
+                series = NavSeries(start_date)
+                self._store(code, series)
+            ranges = series.missing_ranges(start_date, end_date, self.tail_ttl)
+            plans[code] = (series, ranges, len(requests))
+            requests.extend((code, s, e) for s, e in ranges)
+
+        results = await self.source.fetch_ranges(requests) if requests else []
+
+        answers = {}
+        for code, (series, ranges, offset) in plans.items():
+            if not ranges:
+                self.hits += 1
+                answers[code] = (series.slice(start_date, end_date, columnar), None, {"cache": "hit"})
+                continue
+            self.misses += 1
+            code_results = results[offset:offset + len(ranges)]
+            debug_info = {
+                "cache": "partial" if series.dates else "miss",
+                "fetched_ranges": [[s.isoformat(), e.isoformat()] for s, e in ranges],
+                "upstream": [result.debug_info for result in code_results],
+            }
+            error = next((result.error for result in code_results if result.error), None)
+            if error:
+                answers[code] = (None, error, debug_info)
+                continue
+            for (s, e), result in zip(ranges, code_results):
+                self._apply(series, s, e, result)
+            self._store(code, series)
+            answers[code] = (series.slice(start_date, end_date, columnar), None, debug_info)
+        return [answers[code] for code in codes]
+
+    async def get_series(self, code: str, start_date: datetime.date, end_date: datetime.date,
+                         columnar: bool = False):
+        return (await self.get_many([code], start_date, end_date, columnar))[0]
+
+
+nav_cache = NavCache(
+    source=build_nav_source(),
+    max_bytes=int(os.environ.get("NAV_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    settle_days=int(os.environ.get("NAV_CACHE_SETTLE_DAYS", 3)),
+    tail_ttl=float(os.environ.get("NAV_CACHE_TAIL_TTL", 300)),
+)
@@ -0,0 +1,187 @@
+import asyncio
+import datetime
+import logging
+import os
+from collections import defaultdict
+from typing import List, Optional, Tuple
+
+from util.eastmoney import get_fund_data_from_api
+
+logger = logging.getLogger("uvicorn.error")
+
+NavRow = Tuple[str, float, Optional[float]]
+RangeRequest = Tuple[str, datetime.date, datetime.date]
+_ONE_DAY = datetime.timedelta(days=1)
+
+
+def parse_nav_items(items: List[dict]) -> List[NavRow]:
+    rows = []
+    for entry in items:
+        val = entry.get("DWJZ")
+        cumulative_val = entry.get("LJJZ")
+        date_str = entry.get("FSRQ")
+        if not val or not date_str:
+            continue
+        try:
+            value = float(val)
+            cumulative_value = float(cumulative_val) if cumulative_val not in (None, "") else None
+        except ValueError:
+            continue
+        rows.append((date_str, value, cumulative_value))
+    rows.sort(key=lambda x: x[0])
+    return rows
+
+
+class RangeResult:
+    """Rows for one (code, start, end) request; ``complete`` is False when part of the range may be missing."""
+
+    __slots__ = ("rows", "error", "debug_info", "complete")
+
+    def __init__(self, rows: List[NavRow], error: Optional[str], debug_info: dict, complete: bool = True):
+        self.rows = rows
+        self.error = error
+        self.debug_info = debug_info
+        self.complete = complete
+
+
+class EastmoneyNavSource:
+    name = "eastmoney"
+
+    async def fetch_ranges(self, requests: List[RangeRequest]) -> List[RangeResult]:
+        results = await asyncio.gather(*[get_fund_data_from_api(code, s, e) for code, s, e in requests])
+        out = []
+        for data_list, error, debug_info in results:
+            if error and error != "No data found.":
+                out.append(RangeResult([], error, debug_info, complete=False))
+                continue
+            out.append(RangeResult(parse_nav_items(data_list or []), None, debug_info,
+                                   complete=not debug_info.get("page_errors")))
+        return out
+
+    async def close(self) -> None:
+        return None
+
+
+class PostgresNavSource:
+    """Reads ranges from GateOfBabylon's fund_nav_daily and asks the fallback source only for uncovered dates.
+
+    Each fund is considered covered from ``coverage_start`` up to the last date stored for it inside the
+    requested range; anything before ``coverage_start`` or after that last date goes to the fallback.
+    """
+
+    name = "postgres"
+
+    RANGE_SQL = """
+    SELECT r.idx, n.nav_date, n.net_asset_value, n.accumulated_asset_value
+    FROM unnest($1::varchar[], $2::date[], $3::date[]) WITH ORDINALITY AS r(fund_id, start_date, end_date, idx)
+    JOIN public.fund_nav_daily n
+      ON n.fund_id = r.fund_id AND n.nav_date BETWEEN r.start_date AND r.end_date
+    ORDER BY r.idx, n.nav_date
+    """
+
+    def __init__(self, dsn: str, fallback: EastmoneyNavSource, coverage_start: datetime.date,
+                 min_size: int = 1, max_size: int = 10):
+        self.dsn = dsn
+        self.fallback = fallback
+        self.coverage_start = coverage_start
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+        self.queries = 0
+        self.failures = 0
+
+    async def _get_pool(self):
+        if self._pool is not None:
+            return self._pool
+        async with self._pool_lock:
+            if self._pool is None:
+                import asyncpg
+                self._pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+        return self._pool
+
+    async def _query(self, requests: List[RangeRequest]):
+        pool = await self._get_pool()
+        self.queries += 1
+        records = await pool.fetch(
+            self.RANGE_SQL,
+            [code for code, _, _ in requests],
+            [s for _, s, _ in requests],
+            [e for _, _, e in requests],
+        )
+        grouped = defaultdict(list)
+        for record in records:
+            accumulated = record["accumulated_asset_value"]
+            grouped[record["idx"] - 1].append((
+                record["nav_date"].isoformat(),
+                float(record["net_asset_value"]),
+                float(accumulated) if accumulated is not None else None,
+            ))
+        return grouped
+
+    def _gaps(self, start: datetime.date, end: datetime.date, rows: List[NavRow]):
+        if not rows:
+            return [(start, end)]
+        gaps = []
+        if start < self.coverage_start:
+            gaps.append((start, min(end, self.coverage_start - _ONE_DAY)))
+        last_stored = datetime.date.fromisoformat(rows[-1][0])
+        if last_stored < end:
+            gaps.append((max(start, last_stored + _ONE_DAY), end))
+        return gaps
+
+    async def fetch_ranges(self, requests: List[RangeRequest]) -> List[RangeResult]:
+        try:
+            grouped = await self._query(requests)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"NAV store query failed, falling back to {self.fallback.name}: {e}")
+            return await self.fallback.fetch_ranges(requests)
+
+        gap_requests = []
+        gap_owner = []
+        for idx, (code, s, e) in enumerate(requests):
+            for gap_start, gap_end in self._gaps(s, e, grouped[idx]):
+                gap_requests.append((code, gap_start, gap_end))
+                gap_owner.append(idx)
+        gap_results = await self.fallback.fetch_ranges(gap_requests) if gap_requests else []
+
+        results = [
+            RangeResult(grouped[idx], None, {"source": self.name, "store_rows": len(grouped[idx]), "upstream": []})
+            for idx in range(len(requests))
+        ]
+        for idx, gap_result in zip(gap_owner, gap_results):
+            result = results[idx]
+            result.debug_info["upstream"].append(gap_result.debug_info)
+            result.rows = result.rows + gap_result.rows
+            if not gap_result.complete:
+                result.complete = False
+            if gap_result.error:
+                result.debug_info.setdefault("upstream_errors", []).append(gap_result.error)
+                if not result.rows:
+                    result.error = gap_result.error
+        return results
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+
+def build_nav_source():
+    upstream = EastmoneyNavSource()
+    dsn = os.environ.get("NAV_DB_DSN")
+    if not dsn:
+        return upstream
+    try:
+        import asyncpg  # noqa: F401
+    except ImportError:
+        logger.warning("NAV_DB_DSN is set but asyncpg is not installed, reading NAVs from eastmoney only")
+        return upstream
+    coverage_start = datetime.date.fromisoformat(os.environ.get("NAV_DB_COVERAGE_START", "2020-01-01"))
+    return PostgresNavSource(
+        dsn,
+        fallback=upstream,
+        coverage_start=coverage_start,
+        max_size=int(os.environ.get("NAV_DB_POOL_SIZE", 10)),
+    )
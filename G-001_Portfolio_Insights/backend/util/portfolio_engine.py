@@ -0,0 +1,69 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from util.columnar import float_column
+
+
+class FundColumns:
+    __slots__ = ("code", "shares", "dates", "values", "cumulative_values")
+
+    def __init__(self, code: str, shares: float, dates: Sequence[str], values: Sequence[float],
+                 cumulative_values: Sequence[Optional[float]]):
+        self.code = code
+        self.shares = shares
+        self.dates = dates
+        self.values = values
+        self.cumulative_values = cumulative_values
+
+
+class AlignedFrame:
+    """NAV matrices (dates x funds) on one shared date index; missing observations are NaN."""
+
+    __slots__ = ("dates", "codes", "shares", "nav", "cumulative")
+
+    def __init__(self, dates: np.ndarray, codes: List[str], shares: np.ndarray, nav: np.ndarray,
+                 cumulative: np.ndarray):
+        self.dates = dates
+        self.codes = codes
+        self.shares = shares
+        self.nav = nav
+        self.cumulative = cumulative
+
+    @property
+    def date_strings(self) -> List[str]:
+        return np.datetime_as_string(self.dates, unit="D").tolist()
+
+
+def align(funds: List[FundColumns]) -> AlignedFrame:
+    fund_dates = [np.asarray(fund.dates, dtype="datetime64[D]") for fund in funds]
+    dates = np.unique(np.concatenate(fund_dates)) if fund_dates else np.array([], dtype="datetime64[D]")
+    nav = np.full((len(dates), len(funds)), np.nan)
+    cumulative = np.full((len(dates), len(funds)), np.nan)
+    for col, (fund, fund_index) in enumerate(zip(funds, fund_dates)):
+        rows = np.searchsorted(dates, fund_index)
+        nav[rows, col] = np.asarray(fund.values, dtype=np.float64)
+        cumulative[rows, col] = float_column(fund.cumulative_values)
+    shares = np.array([fund.shares for fund in funds], dtype=np.float64)
+    return AlignedFrame(dates, [fund.code for fund in funds], shares, nav, cumulative)
+
+
+def _normalize(series: np.ndarray) -> np.ndarray:
+    base = series[0] if len(series) else 0.0
+    if not base:
+        return np.zeros_like(series)
+    return series / base
+
+
+def aggregate(frame: AlignedFrame) -> dict:
+    # A fund without an observation on a date contributes nothing to that date, as before.
+    total_value = np.nan_to_num(frame.nav) @ frame.shares
+    performance_value = np.nan_to_num(frame.cumulative) @ frame.shares
+    return {
+        "total_value": total_value,
+        "performance_value": performance_value,
+        "normalized_value": _normalize(performance_value),
+        "normalized_total_value": _normalize(total_value),
+        "base_value": float(performance_value[0]) if len(performance_value) else 0.0,
+        "base_total_value": float(total_value[0]) if len(total_value) else 0.0,
+    }
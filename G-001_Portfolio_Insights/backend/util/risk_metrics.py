@@ -0,0 +1,85 @@
+from typing import List
+
+import numpy as np
+
+
+def _forward_fill(matrix: np.ndarray) -> np.ndarray:
+    valid = ~np.isnan(matrix)
+    index = np.where(valid, np.arange(matrix.shape[0])[:, None], 0)
+    np.maximum.accumulate(index, axis=0, out=index)
+    filled = matrix[index, np.arange(matrix.shape[1])]
+    # Leading gaps have nothing to carry forward.
+    filled[np.cumsum(valid, axis=0) == 0] = np.nan
+    return filled
+
+
+def _shift_down(matrix: np.ndarray) -> np.ndarray:
+    shifted = np.full_like(matrix, np.nan)
+    shifted[1:] = matrix[:-1]
+    return shifted
+
+
+def compute_metrics(matrix: np.ndarray, dates: np.ndarray, periods_per_year: float = 252,
+                    risk_free_rate: float = 0.0) -> List[dict]:
+    """Return, Sharpe and max drawdown for every column of a (dates x series) value matrix.
+
+    Missing values (NaN) are skipped, so returns are taken between consecutive observations of
+    each column, matching what the frontend computed per fund.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix[:, None]
+    n_cols = matrix.shape[1]
+    valid = ~np.isnan(matrix)
+    filled = _forward_fill(matrix)
+    prev = _shift_down(filled)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = matrix / prev - 1.0
+    returns[~valid | np.isnan(prev) | (prev == 0)] = np.nan
+    returns -= risk_free_rate / periods_per_year
+    return_valid = ~np.isnan(returns)
+    counts = return_valid.sum(axis=0)
+    safe_counts = np.maximum(counts, 1)
+    mean = np.where(return_valid, returns, 0.0).sum(axis=0) / safe_counts
+    variance = np.where(return_valid, (returns - mean) ** 2, 0.0).sum(axis=0) / safe_counts
+    std = np.sqrt(variance)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(std > 0, mean / std * np.sqrt(periods_per_year), 0.0)
+
+    peak = np.fmax.accumulate(filled, axis=0)
+    prev_peak = _shift_down(peak)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown = np.where(valid & (peak != 0), (matrix - peak) / peak, np.nan)
+    rows = np.arange(matrix.shape[0])[:, None]
+    is_new_peak = valid & (np.isnan(prev_peak) | (matrix > prev_peak))
+    peak_pos = np.maximum.accumulate(np.where(is_new_peak, rows, 0), axis=0)
+    has_drawdown = (np.where(np.isnan(drawdown), 0.0, drawdown) < 0).any(axis=0)
+    trough = np.argmin(np.where(np.isnan(drawdown), np.inf, drawdown), axis=0)
+    cols = np.arange(n_cols)
+    max_drawdown = np.where(has_drawdown, drawdown[trough, cols], 0.0)
+    peak_at_trough = peak_pos[trough, cols]
+    drawdown_days = np.where(
+        has_drawdown, (dates[trough] - dates[peak_at_trough]).astype("timedelta64[D]").astype(np.int64), 0
+    )
+
+    first_idx = np.argmax(valid, axis=0)
+    last_idx = matrix.shape[0] - 1 - np.argmax(valid[::-1], axis=0)
+    first = matrix[first_idx, cols]
+    last = matrix[last_idx, cols]
+
+    metrics = []
+    for col in range(n_cols):
+        if counts[col] == 0:
+            metrics.append({"return_ratio": None, "sharpe": None, "max_drawdown": None,
+                            "max_drawdown_days": None, "drawdown_start": None, "drawdown_end": None})
+            continue
+        metrics.append({
+            "return_ratio": float(last[col] / first[col] - 1) if first[col] else None,
+            "sharpe": float(sharpe[col]),
+            "max_drawdown": float(max_drawdown[col]),
+            "max_drawdown_days": int(drawdown_days[col]),
+            "drawdown_start": str(dates[peak_at_trough[col]]) if has_drawdown[col] else None,
+            "drawdown_end": str(dates[trough[col]]) if has_drawdown[col] else None,
+        })
+    return metrics
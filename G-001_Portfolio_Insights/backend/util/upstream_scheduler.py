@@ -0,0 +1,132 @@
+import asyncio
+import contextvars
+import itertools
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Hashable, Optional, Tuple
+
+# Identifies the inbound request an upstream call belongs to; queued calls are served round-robin per flow.
+upstream_flow: contextvars.ContextVar[Hashable] = contextvars.ContextVar("upstream_flow", default="default")
+_flow_ids = itertools.count(1)
+
+
+def new_flow() -> contextvars.Token:
+    return upstream_flow.set(next(_flow_ids))
+
+
+class UpstreamScheduler:
+    """Process-wide token-bucket rate limit plus in-flight cap, with fair queuing across flows."""
+
+    def __init__(self, rate: float, burst: int, max_inflight: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_inflight = max(1, max_inflight)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._queues: "OrderedDict[Hashable, Deque[Tuple[asyncio.Future, float]]]" = OrderedDict()
+        self._inflight = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.granted = 0
+        self.queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate > 0:
+            self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _has_token(self) -> bool:
+        return self.rate <= 0 or self._tokens >= 1.0
+
+    def _grant(self, enqueued_at: float) -> None:
+        self._inflight += 1
+        if self.rate > 0:
+            self._tokens -= 1.0
+        wait = time.monotonic() - enqueued_at
+        self.granted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def _ensure_dispatcher(self) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        else:
+            self._wakeup.set()
+
+    async def _dispatch(self) -> None:
+        while self._queues:
+            self._refill()
+            if self._inflight >= self.max_inflight:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if not self._has_token():
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+                continue
+            flow, queue = next(iter(self._queues.items()))
+            future, enqueued_at = queue.popleft()
+            if queue:
+                self._queues.move_to_end(flow)
+            else:
+                del self._queues[flow]
+            if future.done():
+                continue
+            self._grant(enqueued_at)
+            future.set_result(None)
+
+    async def acquire(self, flow: Optional[Hashable] = None) -> None:
+        flow = upstream_flow.get() if flow is None else flow
+        self._refill()
+        if not self._queues and self._inflight < self.max_inflight and self._has_token():
+            self._grant(time.monotonic())
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(flow, deque()).append((future, time.monotonic()))
+        self.queued += 1
+        self._ensure_dispatcher()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self._inflight -= 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    @asynccontextmanager
+    async def slot(self, flow: Optional[Hashable] = None):
+        await self.acquire(flow)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "max_inflight": self.max_inflight,
+            "inflight": self._inflight,
+            "queue_depth": sum(len(queue) for queue in self._queues.values()),
+            "queued_flows": len(self._queues),
+            "granted": self.granted,
+            "queued": self.queued,
+            "avg_wait_ms": self.total_wait / self.granted * 1000 if self.granted else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+upstream_scheduler = UpstreamScheduler(
+    rate=float(os.environ.get("UPSTREAM_RATE", 50)),
+    burst=int(os.environ.get("UPSTREAM_BURST", 50)),
+    max_inflight=int(os.environ.get("UPSTREAM_MAX_INFLIGHT", 32)),
+)
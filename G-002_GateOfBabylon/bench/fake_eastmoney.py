@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import bisect
+import datetime
+import json
+import math
+import random
+import zlib
+from typing import Dict, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+REASONS = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 503: "Service Unavailable"}
+FUND_TYPES = ["gp", "hh", "zq", "zs", "qdii", "lof", "fof"]
+
+
+class FakeEastmoney:
+    """Deterministic stand-in for the lsjz and rankhandler endpoints.
+
+    Fund ``i`` has code ``f"{i:06d}"`` and publishes a NAV on every weekday from its inception (spread over the
+    first ``inception_spread`` weekdays after ``start``) up to yesterday; values only depend on code and date.
+    """
+
+    def __init__(self, funds: int, start: datetime.date, inception_spread: int, latency: float, jitter: float,
+                 error_rate: float, throttle_rate: float, page_cap: int, max_inflight: int, seed: int):
+        self.funds = funds
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.page_cap = page_cap
+        self.max_inflight = max_inflight
+        self.random = random.Random(seed)
+        today = datetime.date.today()
+        days = []
+        d = start
+        while d < today:
+            if d.weekday() < 5:
+                days.append(d.isoformat())
+            d += datetime.timedelta(days=1)
+        self.days = days
+        self.inception_spread = max(1, min(inception_spread, len(days)))
+        self.inflight = 0
+        self.stats = {"requests": 0, "lsjz": 0, "rank": 0, "errors_injected": 0, "throttled": 0, "max_inflight": 0}
+
+    def _fund_index(self, code: str) -> int:
+        if len(code) != 6 or not code.isdigit():
+            return 0
+        index = int(code)
+        return index if 1 <= index <= self.funds else 0
+
+    def _nav(self, index: int, day: int) -> Tuple[str, str]:
+        base = 1.0 + (index % 50) / 25.0
+        phase = (zlib.crc32(str(index).encode()) % 628) / 100.0
+        value = base * (1.0 + 0.0002 * day + 0.03 * math.sin(day / 17.0 + phase))
+        return f"{value:.4f}", f"{value + (index % 7) / 10.0:.4f}"
+
+    def lsjz(self, params: Dict[str, str]) -> dict:
+        index = self._fund_index(params.get("fundCode", ""))
+        page_index = max(1, int(params.get("pageIndex") or 1))
+        page_size = max(1, int(params.get("pageSize") or 20))
+        if self.page_cap:
+            page_size = min(page_size, self.page_cap)
+        items = []
+        total = 0
+        if index:
+            first = (index * 7919) % self.inception_spread
+            lo = max(first, bisect.bisect_left(self.days, params.get("startDate") or ""))
+            end_date = params.get("endDate")
+            hi = bisect.bisect_right(self.days, end_date) if end_date else len(self.days)
+            total = max(0, hi - lo)
+            # Newest first, like the real endpoint.
+            top = hi - (page_index - 1) * page_size
+            for day in range(top - 1, max(lo, top - page_size) - 1, -1):
+                dwjz, ljjz = self._nav(index, day)
+                items.append({"FSRQ": self.days[day], "DWJZ": dwjz, "LJJZ": ljjz, "SDATE": None, "ACTUALSYI": "",
+                              "NAVTYPE": "1", "JZZZL": "0.00", "SGZT": "开放申购", "SHZT": "开放赎回", "FHFCZ": "",
+                              "FHFCBZ": "", "DTYPE": None, "FHSP": ""})
+        return {"Data": {"LSJZList": items, "FundType": "002", "SYType": None, "isNewType": False, "Feature": "050,051"},
+                "ErrCode": 0, "ErrMsg": None, "TotalCount": total, "Expansion": None,
+                "PageSize": page_size, "PageIndex": page_index}
+
+    def rank(self, params: Dict[str, str]) -> str:
+        ft = params.get("ft", "all")
+        slot = FUND_TYPES.index(ft) if ft in FUND_TYPES else None
+        rows = []
+        for index in range(1, self.funds + 1):
+            if slot is not None and index % len(FUND_TYPES) != slot:
+                continue
+            code = f"{index:06d}"
+            rows.append(f'"{code},基准测试基金{index},JZCSJJ{index},2024-01-01,1.0000,1.0000,0.01"')
+        return f"var rankData = {{datas:[{','.join(rows)}],allRecords:{len(rows)},pageIndex:1,pageNum:30000}};"
+
+    async def route(self, target: str) -> Tuple[int, str, bytes]:
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        if url.path == "/__stats":
+            if params.get("reset"):
+                for key in self.stats:
+                    self.stats[key] = 0
+            return 200, "application/json", json.dumps(self.stats).encode()
+        self.stats["requests"] += 1
+        self.inflight += 1
+        self.stats["max_inflight"] = max(self.stats["max_inflight"], self.inflight)
+        try:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.max_inflight and self.inflight > self.max_inflight or self.random.random() < self.throttle_rate:
+                self.stats["throttled"] += 1
+                return 429, "text/plain", b"too many requests"
+            if self.random.random() < self.error_rate:
+                self.stats["errors_injected"] += 1
+                return 503, "text/plain", b"service unavailable"
+            if url.path.endswith("/f10/lsjz"):
+                self.stats["lsjz"] += 1
+                return 200, "application/json", json.dumps(self.lsjz(params), ensure_ascii=False).encode()
+            if url.path.endswith("/rankhandler.aspx"):
+                self.stats["rank"] += 1
+                return 200, "text/plain; charset=utf-8", self.rank(params).encode()
+            return 404, "text/plain", b"not found"
+        finally:
+            self.inflight -= 1
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, target, _ = request_line.decode("latin-1").split(" ", 2)
+                keep_alive = True
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.strip().lower() == "connection" and value.strip().lower() == "close":
+                        keep_alive = False
+                status, content_type, body = await self.route(target)
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="本地模拟的东方财富 lsjz / rankhandler 接口")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=18080)
+    p.add_argument("--funds", type=int, default=200, help="基金数量")
+    p.add_argument("--start", default="2020-01-01", help="最早的净值日期")
+    p.add_argument("--inception-spread", type=int, default=250, help="各基金成立日分布在 --start 之后的多少个交易日内")
+    p.add_argument("--latency-ms", type=float, default=30.0, help="每个请求的基础延迟")
+    p.add_argument("--jitter-ms", type=float, default=20.0, help="在基础延迟上叠加的随机延迟上限")
+    p.add_argument("--error-rate", type=float, default=0.0, help="随机返回 503 的比例")
+    p.add_argument("--throttle-rate", type=float, default=0.0, help="随机返回 429 的比例")
+    p.add_argument("--page-cap", type=int, default=0, help="单页最多返回的条数，0 表示不限制")
+    p.add_argument("--max-inflight", type=int, default=0, help="并发请求超过该值时返回 429，0 表示不限制")
+    p.add_argument("--seed", type=int, default=0)
+    return p.parse_args()
+
+
+async def serve(args) -> None:
+    fake = FakeEastmoney(
+        funds=args.funds,
+        start=datetime.date.fromisoformat(args.start),
+        inception_spread=args.inception_spread,
+        latency=args.latency_ms / 1000.0,
+        jitter=args.jitter_ms / 1000.0,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        page_cap=args.page_cap,
+        max_inflight=args.max_inflight,
+        seed=args.seed,
+    )
+    server = await asyncio.start_server(fake.handle, args.host, args.port, backlog=1024)
+    print(f"fake eastmoney listening on http://{args.host}:{args.port} funds={args.funds} days={len(fake.days)}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        pass
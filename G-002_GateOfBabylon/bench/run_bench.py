@@ -0,0 +1,186 @@
+import argparse
+import datetime
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import List, Optional
+
+import psycopg2
+import yaml
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+EASTMONEY_DIR = os.path.join(BENCH_DIR, "..", "eastmoney")
+RESET_TABLES = ["fund_nav_job_item", "fund_nav_job", "fund_nav_daily", "fund_info"]
+
+
+def load_yaml_config(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def get_conn(cfg: dict):
+    return psycopg2.connect(host=cfg.get("host") or "127.0.0.1", port=int(cfg.get("port") or 5432),
+                            user=cfg.get("user"), password=cfg.get("password"), dbname=cfg.get("database"))
+
+
+def reset_tables(cfg: dict) -> None:
+    conn = get_conn(cfg)
+    try:
+        with conn.cursor() as cur:
+            existing = []
+            for table in RESET_TABLES:
+                cur.execute("SELECT to_regclass(%s)", (f"public.{table}",))
+                if cur.fetchone()[0]:
+                    existing.append(f"public.{table}")
+            if existing:
+                cur.execute(f"TRUNCATE {', '.join(existing)}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def count_rows(cfg: dict, table: str) -> int:
+    conn = get_conn(cfg)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)", (f"public.{table}",))
+            if not cur.fetchone()[0]:
+                return 0
+            cur.execute(f"SELECT COUNT(*) FROM public.{table}")
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def upstream_stats(base: str, reset: bool = False) -> dict:
+    with urllib.request.urlopen(f"{base}/__stats{'?reset=1' if reset else ''}", timeout=5) as r:
+        return json.loads(r.read())
+
+
+def wait_for_server(base: str, proc: subprocess.Popen, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("模拟服务启动失败")
+        try:
+            upstream_stats(base)
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit("等待模拟服务启动超时")
+
+
+def run_stage(name: str, argv: List[str], env: dict, log_dir: str) -> dict:
+    log_path = os.path.join(log_dir, f"{name}.log")
+    started = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.Popen([sys.executable] + argv, cwd=EASTMONEY_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, "wait4"):
+            # wait4 gives this child's own peak RSS rather than the maximum over every child so far.
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            peak_rss_mb: Optional[float] = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+            cpu_s: Optional[float] = usage.ru_utime + usage.ru_stime
+        else:
+            proc.wait()
+            peak_rss_mb = None
+            cpu_s = None
+    elapsed = time.perf_counter() - started
+    return {"stage": name, "exit_code": proc.returncode, "seconds": elapsed, "cpu_seconds": cpu_s,
+            "peak_rss_mb": peak_rss_mb, "log": log_path}
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="用本地模拟接口和本地 PostgreSQL 跑一遍完整的入库流程并输出吞吐数据")
+    p.add_argument("--config", required=True, help="本地 PostgreSQL 的 YAML 配置（会清空相关表，请勿指向生产库）")
+    p.add_argument("--funds", type=int, default=200)
+    p.add_argument("--start-date", default="2020-01-01")
+    p.add_argument("--end-date", default=f"{datetime.date.today()}")
+    p.add_argument("--latency-ms", type=float, default=30.0)
+    p.add_argument("--jitter-ms", type=float, default=20.0)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--throttle-rate", type=float, default=0.0)
+    p.add_argument("--page-cap", type=int, default=0)
+    p.add_argument("--max-inflight", type=int, default=0, help="模拟服务的并发上限，超过返回 429")
+    p.add_argument("--nav-args", default="", help="透传给 seed_fund_nav_daily.py 的参数，如 \"--concurrency 32\"")
+    p.add_argument("--no-reset", action="store_true", help="不清空 fund_info / fund_nav_daily / 任务表")
+    p.add_argument("--log-dir", default=os.path.join(BENCH_DIR, "logs"))
+    p.add_argument("--output", default=None, help="把结果另存为 JSON")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    cfg = load_yaml_config(args.config)
+    os.makedirs(args.log_dir, exist_ok=True)
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    server_cmd = [
+        sys.executable, os.path.join(BENCH_DIR, "fake_eastmoney.py"), "--port", str(port),
+        "--funds", str(args.funds), "--start", args.start_date,
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate), "--throttle-rate", str(args.throttle_rate),
+        "--page-cap", str(args.page_cap), "--max-inflight", str(args.max_inflight),
+    ]
+    server = subprocess.Popen(server_cmd, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_server(base, server)
+        if not args.no_reset:
+            reset_tables(cfg)
+        env = dict(os.environ)
+        env["EASTMONEY_NAV_URL"] = f"{base}/f10/lsjz"
+        env["EASTMONEY_RANK_URL"] = f"{base}/data/rankhandler.aspx?op=ph&dt=kf&ft={{ft}}&pi=1&pn=30000&dx=1"
+        config_path = os.path.abspath(args.config)
+        nav_args = ["seed_fund_nav_daily.py", "--config", config_path, "--start-date", args.start_date,
+                    "--end-date", args.end_date] + shlex.split(args.nav_args)
+        stages = [
+            ("fund_info", ["seed_fund_info.py", "--config", config_path], "fund_info"),
+            ("nav_backfill", nav_args, "fund_nav_daily"),
+            ("nav_incremental", nav_args + ["--incremental"], "fund_nav_daily"),
+        ]
+        results = []
+        for name, argv, table in stages:
+            before_rows = count_rows(cfg, table)
+            # Zero the fake server's counters so every figure below, the in-flight peak included, is this stage's own.
+            upstream_stats(base, reset=True)
+            result = run_stage(name, argv, env, args.log_dir)
+            upstream = upstream_stats(base)
+            rows = count_rows(cfg, table) - before_rows
+            requests = upstream["requests"]
+            result.update({
+                "rows": rows,
+                "rows_per_s": rows / result["seconds"] if result["seconds"] else 0.0,
+                "requests": requests,
+                "requests_per_s": requests / result["seconds"] if result["seconds"] else 0.0,
+                "upstream_errors": upstream["errors_injected"],
+                "upstream_throttled": upstream["throttled"],
+                "upstream_max_inflight": upstream["max_inflight"],
+            })
+            results.append(result)
+            print(f"{name:<16} exit={result['exit_code']} {result['seconds']:8.2f}s rows={rows:<9} "
+                  f"rows/s={result['rows_per_s']:10.1f} requests={requests:<7} req/s={result['requests_per_s']:8.1f} "
+                  f"peak_rss={result['peak_rss_mb'] or 0:7.1f}MB cpu={result['cpu_seconds'] or 0:7.2f}s", flush=True)
+            if result["exit_code"] != 0:
+                print(f"{name} 失败，日志见 {result['log']}", flush=True)
+                break
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"args": vars(args), "stages": results}, f, ensure_ascii=False, indent=2)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import datetime
+import logging
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from seed_fund_nav_daily import get_conn, load_yaml_config
+from util.navstore import FIELDS, NavStoreWriter
+
+# Rows are selected by _update_timestamp, which is the start time of the transaction that wrote them; a seed
+# transaction still open when the previous sync took its snapshot can commit rows stamped before that sync.
+# Re-reading this much history on every sync is harmless because put() overwrites.
+SYNC_OVERLAP_MINUTES = 60
+FETCH_SIZE = 100000
+
+def changed_filter(since: Optional[datetime.datetime]) -> Tuple[str, tuple]:
+    if since is None:
+        return "", ()
+    return "WHERE _update_timestamp > %s", (since,)
+
+def fetch_keys(conn, since: Optional[datetime.datetime]) -> Tuple[List[str], np.ndarray]:
+    # Both key sets in one pass over the changed rows.
+    where, params = changed_filter(since)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT array_agg(DISTINCT fund_id), array_agg(DISTINCT nav_date - DATE '1970-01-01') "
+            f"FROM public.fund_nav_daily {where}",
+            params,
+        )
+        fund_ids, days = cur.fetchone()
+    return fund_ids or [], np.array(days or [], dtype=np.int32)
+
+def iter_rows(conn, since: Optional[datetime.datetime], fetch_size: int) -> Iterator[list]:
+    where, params = changed_filter(since)
+    columns = ", ".join(f"{field}::float8" for field in FIELDS)
+    with conn.cursor(name="nav_store_export") as cur:
+        cur.itersize = fetch_size
+        cur.execute(f"SELECT fund_id, nav_date - DATE '1970-01-01', {columns} FROM public.fund_nav_daily {where}", params)
+        while True:
+            batch = cur.fetchmany(fetch_size)
+            if not batch:
+                break
+            yield batch
+
+def sync_store(conn, store: NavStoreWriter, rebuild: bool, fetch_size: int, overlap: datetime.timedelta) -> dict:
+    # One snapshot for the keys and the rows, so the axis planned up front covers every row read afterwards.
+    conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    with conn.cursor() as cur:
+        cur.execute("SELECT now()")
+        snapshot_at = cur.fetchone()[0]
+    if rebuild or not store.exists:
+        store.reset()
+        since = None
+    else:
+        since = datetime.datetime.fromisoformat(store.meta["synced_at"]) - overlap
+    fund_ids, days = fetch_keys(conn, since)
+    if not store.plan(fund_ids, days):
+        logging.info("changed rows include a date inside the existing axis, rebuilding the store")
+        store.reset()
+        since = None
+        fund_ids, days = fetch_keys(conn, since)
+        store.plan(fund_ids, days)
+    rows = 0
+    for batch in iter_rows(conn, since, fetch_size):
+        values = {field: np.fromiter((r[2 + i] for r in batch), dtype=np.float64, count=len(batch))
+                  for i, field in enumerate(FIELDS)}
+        store.put([r[0] for r in batch], np.fromiter((r[1] for r in batch), dtype=np.int32, count=len(batch)), values)
+        rows += len(batch)
+    conn.rollback()
+    store.commit(snapshot_at.isoformat())
+    return {"mode": "full" if since is None else "incremental", "rows": rows, "funds": len(store.fund_ids),
+            "dates": len(store.days), "generation": store.generation, "synced_at": store.meta["synced_at"]}
+
+def parse_args():
+    p = argparse.ArgumentParser(description="把 fund_nav_daily 导出为本地内存映射列式净值库，并按更新时间增量同步")
+    p.add_argument("--config", default=None, help="YAML 配置文件路径，默认 eastmoney/config.yaml")
+    p.add_argument("--store-dir", default="data/nav_store", help="本地净值库目录")
+    p.add_argument("--rebuild", action="store_true", help="忽略已有数据，全量重建")
+    p.add_argument("--overlap-minutes", type=float, default=SYNC_OVERLAP_MINUTES, help="增量同步时向前多读的分钟数")
+    p.add_argument("--fetch-size", type=int, default=FETCH_SIZE, help="服务端游标每批读取的行数")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    cfg = load_yaml_config(args.config)
+    store = NavStoreWriter(args.store_dir)
+    conn = get_conn(cfg)
+    started = time.perf_counter()
+    try:
+        result = sync_store(conn, store, args.rebuild, args.fetch_size, datetime.timedelta(minutes=args.overlap_minutes))
+    finally:
+        store.close()
+        conn.close()
+    logging.info(
+        f"nav store {args.store_dir}: mode={result['mode']}, rows={result['rows']}, funds={result['funds']}, "
+        f"dates={result['dates']}, generation={result['generation']}, synced_at={result['synced_at']}, "
+        f"elapsed={time.perf_counter() - started:.2f}s"
+    )
+
+if __name__ == "__main__":
+    main()
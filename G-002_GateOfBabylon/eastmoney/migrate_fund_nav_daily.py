@@ -0,0 +1,66 @@
+import argparse
+import logging
+
+from seed_fund_nav_daily import apply_schema, get_conn, is_partitioned, load_yaml_config
+
+LEGACY_TABLE = "fund_nav_daily_legacy"
+COLUMNS = "fund_id, nav_date, net_asset_value, accumulated_asset_value, _create_timestamp, _update_timestamp"
+
+def migrate(conn, keep_legacy: bool) -> int:
+    # One transaction: on any failure the original table is left untouched.
+    with conn.cursor() as cur:
+        cur.execute("LOCK TABLE public.fund_nav_daily IN ACCESS EXCLUSIVE MODE")
+        cur.execute(f"ALTER TABLE public.fund_nav_daily RENAME TO {LEGACY_TABLE}")
+        cur.execute(f"ALTER TABLE public.{LEGACY_TABLE} RENAME CONSTRAINT fund_nav_daily_pkey TO {LEGACY_TABLE}_pkey")
+        cur.execute(f"ALTER INDEX IF EXISTS public.fund_nav_daily_nav_date_brin RENAME TO {LEGACY_TABLE}_nav_date_brin")
+        cur.execute(f"ALTER INDEX IF EXISTS public.fund_nav_daily_update_ts_brin RENAME TO {LEGACY_TABLE}_update_ts_brin")
+        cur.execute(f"DROP TRIGGER IF EXISTS fund_nav_daily_set_updated ON public.{LEGACY_TABLE}")
+        apply_schema(cur)
+        cur.execute(f"SELECT MIN(nav_date), MAX(nav_date), COUNT(*) FROM public.{LEGACY_TABLE}")
+        min_date, max_date, total = cur.fetchone()
+        copied = 0
+        if total:
+            cur.execute("SELECT public.ensure_fund_nav_daily_partitions(%s, %s)", (min_date, max_date))
+            logging.info(f"partitions created: {cur.fetchone()[0]}, range={min_date.year}~{max_date.year}")
+            for year in range(min_date.year, max_date.year + 1):
+                cur.execute(
+                    f"""
+                    INSERT INTO public.fund_nav_daily ({COLUMNS})
+                    SELECT {COLUMNS} FROM public.{LEGACY_TABLE}
+                    WHERE nav_date >= make_date(%s, 1, 1) AND nav_date < make_date(%s, 1, 1)
+                    """,
+                    (year, year + 1),
+                )
+                copied += cur.rowcount
+                logging.info(f"year {year}: copied {cur.rowcount} rows, total {copied}/{total}")
+        if copied != total:
+            raise RuntimeError(f"迁移行数不一致: 旧表 {total} 行，新表 {copied} 行")
+        if not keep_legacy:
+            cur.execute(f"DROP TABLE public.{LEGACY_TABLE}")
+    conn.commit()
+    return copied
+
+def parse_args():
+    p = argparse.ArgumentParser(description="把 fund_nav_daily 单表迁移为按年分区表")
+    p.add_argument("--config", default=None, help="YAML 配置文件路径，默认 eastmoney/config.yaml")
+    p.add_argument("--keep-legacy", action="store_true", help=f"迁移后保留旧表 {LEGACY_TABLE}")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    cfg = load_yaml_config(args.config)
+    conn = get_conn(cfg)
+    try:
+        if is_partitioned(conn):
+            logging.info("fund_nav_daily is already partitioned, nothing to do")
+            return
+        copied = migrate(conn, args.keep_legacy)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE public.fund_nav_daily")
+        logging.info(f"migrated {copied} rows into partitioned fund_nav_daily")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
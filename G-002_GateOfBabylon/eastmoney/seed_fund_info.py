@@ -1,13 +1,13 @@
 import argparse
 import asyncio
 import os
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import psycopg2
 import yaml
 from psycopg2.extras import execute_values
 
-from util.eastmoney import fetch_all_pairs
+from util.eastmoney import collect_all_pairs
 
 DDL_STMTS = [
     """
@@ -46,11 +46,37 @@ def ensure_schema(conn, tz: str = "UTC") -> None:
             cur.execute(s)
     conn.commit()
 
+def fetch_stored_names(conn) -> Dict[str, str]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT fund_id, fund_name FROM public.fund_info")
+        return dict(cur.fetchall())
+
+def diff_funds(stored: Dict[str, str], latest: Dict[str, str], complete: bool) -> Tuple[List[Tuple[str, str]], Dict[str, Optional[int]]]:
+    changes = []
+    new = renamed = 0
+    for code, name in latest.items():
+        old = stored.get(code)
+        if old == name:
+            continue
+        if old is None:
+            new += 1
+        else:
+            renamed += 1
+        changes.append((code, name))
+    # A failed fund type would make all of its funds look delisted, so only count when every list arrived.
+    delisted = sum(1 for code in stored if code not in latest) if complete else None
+    counts = {"total": len(latest), "new": new, "renamed": renamed, "delisted": delisted,
+              "unchanged": len(latest) - new - renamed}
+    return sorted(changes), counts
+
 def upsert_funds(conn, pairs: List[Tuple[str, str]]) -> int:
+    if not pairs:
+        return 0
     sql = """
     INSERT INTO public.fund_info (fund_id, fund_name)
     VALUES %s
     ON CONFLICT (fund_id) DO UPDATE SET fund_name = EXCLUDED.fund_name
+    WHERE public.fund_info.fund_name IS DISTINCT FROM EXCLUDED.fund_name
     """
     with conn.cursor() as cur:
         execute_values(cur, sql, pairs, page_size=2000)
@@ -81,15 +107,19 @@ def parse_args():
     return p.parse_args()
 
 async def async_main():
-    pairs_map = await fetch_all_pairs()
-    pairs = sorted(pairs_map.items(), key=lambda x: x[0])
     args = parse_args()
     ycfg = load_yaml_config(args.config)
     tz = ycfg.get("timezone") or "UTC"
     conn = get_conn(args)
     try:
         ensure_schema(conn, tz=tz)
-        n = upsert_funds(conn, pairs)
+        stored = fetch_stored_names(conn)
+        latest, failed_types = await collect_all_pairs()
+        if failed_types:
+            print(f"rank lists failed for {failed_types}, delisted count skipped")
+        changes, counts = diff_funds(stored, latest, complete=not failed_types)
+        n = upsert_funds(conn, changes)
+        print(f"fund_info: total={counts['total']}, new={counts['new']}, renamed={counts['renamed']}, delisted={'skipped' if counts['delisted'] is None else counts['delisted']}, unchanged={counts['unchanged']}")
         print(f"upsert {n} rows into public.fund_info")
     finally:
         conn.close()
@@ -2,19 +2,28 @@ import argparse
 import asyncio
 import datetime
 import datetime as dt
+import io
+import json
 import logging
+import math
 import os
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+import time
+from contextlib import contextmanager
 from decimal import Decimal, InvalidOperation
-from typing import List, Tuple, Optional
+from functools import partial
+from typing import Dict, List, Tuple, Optional
 
 import psycopg2
 import yaml
-from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from pydantic import BaseModel
 
-from util.eastmoney import FundNavQuery, get_fund_nav_raw_from_api
+from util.archive import RawArchive
+from util.eastmoney import FundNavQuery, NavPartialError, close_nav_client, get_fund_nav_raw_from_api, nav_limiter, open_nav_client, set_nav_archive
+from util.metrics import metrics
+from util.profiler import SamplingProfiler
+from util.schedule import EMPTY_CHECK_HISTORY, FETCH_DECISIONS, FundCadence, TradingCalendar, decide, infer_cadence, infer_lag
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
 logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -26,16 +35,13 @@ class FundNavRow(BaseModel):
     net_asset_value: Optional[Decimal] = None
     accumulated_asset_value: Optional[Decimal] = None
 
-class FetchBatchResult(BaseModel):
-    rows: List[FundNavRow]
-    errors: int
-    updated_funds: int
-
-class WriteTaskMeta(BaseModel):
-    batch_idx: int
-    batch_size: int
-    row_count: int
-    updated_funds: int
+class PipelineStats(BaseModel):
+    total_funds: int = 0
+    fetched_funds: int = 0
+    updated_funds: int = 0
+    written_rows: int = 0
+    errors: int = 0
+    failed_writes: int = 0
 
 
 def load_yaml_config(path: str | None) -> dict:
@@ -45,7 +51,7 @@ def load_yaml_config(path: str | None) -> dict:
             return yaml.safe_load(f) or {}
     return {}
 
-def get_conn(cfg: dict) -> psycopg2.extensions.connection:
+def conn_kwargs(cfg: dict) -> dict:
     host = cfg.get("host") or "pgm-bp1z198qck54m3k0yo.pg.rds.aliyuncs.com"
     port = int(cfg.get("port") or "5432")
     user = cfg.get("user")
@@ -53,22 +59,241 @@ def get_conn(cfg: dict) -> psycopg2.extensions.connection:
     dbname = cfg.get("database")
     if not (user and password and dbname):
         raise SystemExit("需要在配置文件中提供 host/port/user/password/database")
-    return psycopg2.connect(host=host, port=port, user=user, password=password, dbname=dbname)
+    return dict(host=host, port=port, user=user, password=password, dbname=dbname)
+
+def get_conn(cfg: dict) -> psycopg2.extensions.connection:
+    return psycopg2.connect(**conn_kwargs(cfg))
+
+class WriterConnectionPool:
+    """Bounded, thread-safe pool shared by all writers; callers block when every connection is checked out."""
+
+    def __init__(self, cfg: dict, size: int, synchronous_commit: str = "off", health_check_after: float = 30.0):
+        self.size = max(1, size)
+        self.timezone = cfg.get("timezone") or "UTC"
+        self.synchronous_commit = synchronous_commit
+        self.health_check_after = health_check_after
+        # minconn == maxconn: psycopg2 closes any connection returned while more than minconn are idle.
+        self._pool = ThreadedConnectionPool(self.size, self.size, **conn_kwargs(cfg))
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._last_used: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.created = 0
+        self.discarded = 0
+
+    def _prepare(self, conn) -> None:
+        with conn.cursor() as cur:
+            cur.execute("SET TIME ZONE %s;", (self.timezone,))
+            cur.execute("SET CLIENT_ENCODING TO 'UTF8';")
+            cur.execute("SET synchronous_commit TO %s;", (self.synchronous_commit,))
+        conn.commit()
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        with self._lock:
+            last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn) -> None:
+        with self._lock:
+            self._last_used.pop(id(conn), None)
+        self.discarded += 1
+        self._pool.putconn(conn, close=True)
+
+    def _checkout(self):
+        while True:
+            conn = self._pool.getconn()
+            with self._lock:
+                is_new = id(conn) not in self._last_used
+            if is_new:
+                try:
+                    self._prepare(conn)
+                except BaseException:
+                    self._discard(conn)
+                    raise
+                self.created += 1
+                return conn
+            if self._healthy(conn):
+                return conn
+            self._discard(conn)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        with self._lock:
+            self.in_use += 1
+        conn = None
+        try:
+            conn = self._checkout()
+            yield conn
+        except Exception:
+            if conn is not None:
+                if not conn.closed:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        pass
+                if conn.closed:
+                    self._discard(conn)
+                    conn = None
+            raise
+        finally:
+            if conn is not None:
+                with self._lock:
+                    self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+SCHEMA_FILES = ("fund_nav_daily.sql", "fund_nav_job.sql")
+
+def apply_schema(cur) -> None:
+    for name in SCHEMA_FILES:
+        schema_path = os.path.join(os.path.dirname(__file__), "..", "schema", name)
+        with open(schema_path, "r", encoding="utf-8") as f:
+            cur.execute(f.read())
 
 def ensure_schema(conn) -> None:
-    schema_path = os.path.join(os.path.dirname(__file__), "..", "schema", "fund_nav_daily.sql")
-    with open(schema_path, "r", encoding="utf-8") as f:
-        ddl = f.read()
     with conn.cursor() as cur:
-        cur.execute(ddl)
+        apply_schema(cur)
     conn.commit()
 
+def is_partitioned(conn) -> bool:
+    with conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('public.fund_nav_daily')")
+        row = cur.fetchone()
+    return row is not None and row[0] == "p"
+
+def ensure_partitions(conn, start_date: datetime.date, end_date: datetime.date) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT public.ensure_fund_nav_daily_partitions(%s, %s)", (start_date, end_date))
+        created = cur.fetchone()[0]
+    conn.commit()
+    return created
+
 def fetch_fund_ids(conn) -> List[str]:
     with conn.cursor() as cur:
         cur.execute("SELECT fund_id FROM public.fund_info ORDER BY fund_id")
         rows = cur.fetchall()
     return [r[0] for r in rows]
 
+def fetch_nav_watermarks(conn) -> Dict[str, datetime.date]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT fund_id, MAX(nav_date) FROM public.fund_nav_daily GROUP BY fund_id")
+        rows = cur.fetchall()
+    return {r[0]: r[1] for r in rows}
+
+def plan_fetch_windows(fund_ids: List[str], start_date: datetime.date, end_date: datetime.date, watermarks: Optional[Dict[str, datetime.date]] = None) -> List[Tuple[str, datetime.date]]:
+    if watermarks is None:
+        return [(fid, start_date) for fid in fund_ids]
+    windows = []
+    for fid in fund_ids:
+        watermark = watermarks.get(fid)
+        fund_start = start_date if watermark is None else max(start_date, watermark + datetime.timedelta(days=1))
+        if fund_start > end_date:
+            continue
+        windows.append((fid, fund_start))
+    return windows
+
+# NAV dates are Beijing dates; first-stored timestamps are compared with them in the same zone.
+MARKET_TIMEZONE = "Asia/Shanghai"
+
+def fetch_trading_day_counts(conn, since: datetime.date) -> Dict[datetime.date, int]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT nav_date, COUNT(*) FROM public.fund_nav_daily WHERE nav_date >= %s GROUP BY nav_date", (since,))
+        rows = cur.fetchall()
+    return {r[0]: r[1] for r in rows}
+
+def fetch_recent_nav_dates(conn, since: datetime.date) -> Dict[str, Tuple[List[datetime.date], List[datetime.date]]]:
+    """Per fund: NAV dates since ``since`` and the (Beijing) date each was first stored."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT fund_id, array_agg(nav_date ORDER BY nav_date), array_agg((_create_timestamp AT TIME ZONE %s)::date ORDER BY nav_date)
+            FROM public.fund_nav_daily WHERE nav_date >= %s GROUP BY fund_id
+            """,
+            (MARKET_TIMEZONE, since),
+        )
+        rows = cur.fetchall()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+def fetch_empty_checks(conn, since: datetime.date) -> Dict[str, List[Tuple[datetime.date, List[datetime.date]]]]:
+    """Per fund: (fund_start, dates of the latest fetches that returned no rows) of completed job items."""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT i.fund_id, i.fund_start,
+                   (array_agg(DISTINCT (i._update_timestamp AT TIME ZONE %s)::date ORDER BY (i._update_timestamp AT TIME ZONE %s)::date DESC))[1:{EMPTY_CHECK_HISTORY}]
+            FROM public.fund_nav_job_item i JOIN public.fund_nav_job j ON j.job_id = i.job_id
+            WHERE i.status = 'done' AND i.rows_fetched = 0 AND j._create_timestamp >= %s
+            GROUP BY i.fund_id, i.fund_start
+            """,
+            (MARKET_TIMEZONE, MARKET_TIMEZONE, since),
+        )
+        rows = cur.fetchall()
+    checks: Dict[str, List[Tuple[datetime.date, List[datetime.date]]]] = {}
+    for fund_id, fund_start, checked in rows:
+        checks.setdefault(fund_id, []).append((fund_start, checked))
+    return checks
+
+def build_cadences(fund_ids: List[str], watermarks: Dict[str, datetime.date], calendar: TradingCalendar,
+                   history: Dict[str, Tuple[List[datetime.date], List[datetime.date]]],
+                   empty_checks: Dict[str, List[Tuple[datetime.date, List[datetime.date]]]]) -> List[FundCadence]:
+    cadences = []
+    for fid in fund_ids:
+        watermark = watermarks.get(fid)
+        nav_dates, stored_dates = history.get(fid, ([], []))
+        # Only empty fetches that started after the current watermark say anything about the next NAV.
+        checked = sorted({d for start, dates in empty_checks.get(fid, []) if watermark is None or start > watermark for d in dates}, reverse=True)
+        cadences.append(FundCadence(
+            fund_id=fid,
+            watermark=watermark,
+            cadence=infer_cadence(calendar, nav_dates),
+            lag=infer_lag(calendar, nav_dates, stored_dates),
+            empty_checks=checked[:EMPTY_CHECK_HISTORY],
+        ))
+    return cadences
+
+def schedule_fetch_windows(conn, windows: List[Tuple[str, datetime.date]], watermarks: Dict[str, datetime.date],
+                           end_date: datetime.date, args) -> List[Tuple[str, datetime.date]]:
+    since = end_date - datetime.timedelta(days=args.schedule_lookback_days)
+    calendar = TradingCalendar.from_counts(fetch_trading_day_counts(conn, since))
+    if not calendar.days:
+        logging.info("schedule: no recent NAV history, fetching every fund")
+        return windows
+    history = fetch_recent_nav_dates(conn, since)
+    empty_checks = fetch_empty_checks(conn, since)
+    cadences = build_cadences([fid for fid, _ in windows], watermarks, calendar, history, empty_checks)
+    counts: Dict[str, int] = {}
+    selected = []
+    for (fid, fund_start), cadence in zip(windows, cadences):
+        decision, _ = decide(cadence, calendar, end_date, args.max_backoff_days, args.dormant_days)
+        counts[decision] = counts.get(decision, 0) + 1
+        if decision in FETCH_DECISIONS:
+            selected.append((fid, fund_start))
+    cadence_counts: Dict[int, int] = {}
+    for cadence in cadences:
+        cadence_counts[cadence.cadence] = cadence_counts.get(cadence.cadence, 0) + 1
+    logging.info(f"schedule: calendar={calendar.days[0]}~{calendar.days[-1]} ({len(calendar.days)} days), decisions={dict(sorted(counts.items()))}, cadences={dict(sorted(cadence_counts.items()))}")
+    logging.info(f"schedule: to_fetch={len(selected)}, skipped={len(windows) - len(selected)}")
+    return selected
+
+# (fund_id, nav_date, net_asset_value, accumulated_asset_value) as the upstream strings, ready for COPY.
+NavRow = Tuple[str, str, Optional[str], Optional[str]]
+
 def to_decimal(value: Optional[str]) -> Optional[Decimal]:
     if value is None:
         return None
@@ -80,7 +305,40 @@ def to_decimal(value: Optional[str]) -> Optional[Decimal]:
     except InvalidOperation:
         return None
 
-def build_rows(fund_id: str, items: List[dict]) -> List[FundNavRow]:
+def to_number_text(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    v = value.strip()
+    if v == "":
+        return None
+    try:
+        number = float(v)
+    except ValueError:
+        return None
+    # NaN/Infinity parse as floats but are not NAVs; the strict path rejects them too.
+    if not math.isfinite(number):
+        return None
+    return v
+
+def build_rows(fund_id: str, items: List[dict]) -> List[NavRow]:
+    rows = []
+    append = rows.append
+    for item in items:
+        date_str = item.get("FSRQ")
+        if not date_str:
+            continue
+        try:
+            datetime.date.fromisoformat(date_str)
+        except ValueError:
+            continue
+        net_value = to_number_text(item.get("DWJZ"))
+        accum_value = to_number_text(item.get("LJJZ"))
+        if net_value is None and accum_value is None:
+            continue
+        append((fund_id, date_str, net_value, accum_value))
+    return rows
+
+def build_rows_strict(fund_id: str, items: List[dict]) -> List[NavRow]:
     rows = []
     for item in items:
         date_str = item.get("FSRQ")
@@ -94,99 +352,346 @@ def build_rows(fund_id: str, items: List[dict]) -> List[FundNavRow]:
         accum_value = to_decimal(item.get("LJJZ"))
         if net_value is None and accum_value is None:
             continue
-        rows.append(
-            FundNavRow(
-                fund_id=fund_id,
-                nav_date=nav_date,
-                net_asset_value=net_value,
-                accumulated_asset_value=accum_value,
-            )
+        row = FundNavRow(
+            fund_id=fund_id,
+            nav_date=nav_date,
+            net_asset_value=net_value,
+            accumulated_asset_value=accum_value,
         )
+        rows.append((
+            row.fund_id,
+            row.nav_date.isoformat(),
+            None if row.net_asset_value is None else str(row.net_asset_value),
+            None if row.accumulated_asset_value is None else str(row.accumulated_asset_value),
+        ))
     return rows
 
-def to_db_values(rows: List[FundNavRow]) -> List[Tuple[str, datetime.date, Optional[Decimal], Optional[Decimal]]]:
-    return [(r.fund_id, r.nav_date, r.net_asset_value, r.accumulated_asset_value) for r in rows]
+STAGING_TABLE = "fund_nav_daily_staging"
+
+# Session-private temp table: never WAL-logged, emptied on every commit, safe for concurrent writers.
+STAGING_DDL = f"""
+CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE}
+  (LIKE public.fund_nav_daily INCLUDING DEFAULTS)
+  ON COMMIT DELETE ROWS
+"""
+
+# Only rows whose values actually changed are updated, so the BEFORE UPDATE trigger skips unchanged rows.
+MERGE_SQL = f"""
+INSERT INTO public.fund_nav_daily (fund_id, nav_date, net_asset_value, accumulated_asset_value)
+SELECT DISTINCT ON (fund_id, nav_date) fund_id, nav_date, net_asset_value, accumulated_asset_value
+FROM {STAGING_TABLE}
+ORDER BY fund_id, nav_date
+ON CONFLICT (fund_id, nav_date) DO UPDATE SET
+  net_asset_value = EXCLUDED.net_asset_value,
+  accumulated_asset_value = EXCLUDED.accumulated_asset_value
+WHERE (public.fund_nav_daily.net_asset_value, public.fund_nav_daily.accumulated_asset_value)
+  IS DISTINCT FROM (EXCLUDED.net_asset_value, EXCLUDED.accumulated_asset_value)
+"""
+
+COPY_NULL = "\\N"
 
-def upsert_rows(conn, rows: List[FundNavRow]) -> int:
+def copy_rows(cur, rows: List[NavRow]) -> None:
+    buf = io.StringIO()
+    # Values are None or non-empty strings, so `or` substitutes NULL exactly.
+    buf.writelines(
+        f"{fund_id}\t{nav_date}\t{net_value or COPY_NULL}\t{accum_value or COPY_NULL}\n"
+        for fund_id, nav_date, net_value, accum_value in rows
+    )
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY {STAGING_TABLE} (fund_id, nav_date, net_asset_value, accumulated_asset_value) FROM STDIN",
+        buf,
+    )
+
+def merge_rows(cur, rows: List[NavRow]) -> int:
     if not rows:
         return 0
-    sql = """
-    INSERT INTO public.fund_nav (fund_id, date, net_asset_value, accumulated_asset_value)
-    VALUES %s
-    ON CONFLICT (fund_id, date) DO UPDATE SET
-      net_asset_value = EXCLUDED.net_asset_value,
-      accumulated_asset_value = EXCLUDED.accumulated_asset_value
-    """
-    values = to_db_values(rows)
-    with conn.cursor() as cur:
-        execute_values(cur, sql, values, page_size=1000)
-    conn.commit()
-    return len(rows)
+    cur.execute(STAGING_DDL)
+    copy_rows(cur, rows)
+    cur.execute(MERGE_SQL)
+    return cur.rowcount
 
-def upsert_rows_with_new_conn(cfg: dict, rows: List[FundNavRow]) -> int:
+def upsert_rows(conn, rows: List[NavRow]) -> int:
     if not rows:
         return 0
-    conn = get_conn(cfg)
+    with conn.cursor() as cur:
+        changed = merge_rows(cur, rows)
+    conn.commit()
+    return changed
+
+def create_job(conn, start_date: datetime.date, end_date: datetime.date, incremental: bool, windows: List[Tuple[str, datetime.date]]) -> int:
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO public.fund_nav_job (start_date, end_date, incremental, total_funds) VALUES (%s, %s, %s, %s) RETURNING job_id",
+            (start_date, end_date, incremental, len(windows)),
+        )
+        job_id = cur.fetchone()[0]
+        cur.execute(
+            "INSERT INTO public.fund_nav_job_item (job_id, fund_id, fund_start) SELECT %s, * FROM unnest(%s::varchar[], %s::date[])",
+            (job_id, [fid for fid, _ in windows], [fund_start for _, fund_start in windows]),
+        )
+    conn.commit()
+    return job_id
+
+def find_job(conn, job_id: Optional[int] = None) -> Optional[Tuple[int, datetime.date, datetime.date, bool]]:
+    with conn.cursor() as cur:
+        if job_id is not None:
+            cur.execute("SELECT job_id, start_date, end_date, incremental FROM public.fund_nav_job WHERE job_id = %s", (job_id,))
+        else:
+            cur.execute("SELECT job_id, start_date, end_date, incremental FROM public.fund_nav_job WHERE status <> 'done' ORDER BY job_id DESC LIMIT 1")
+        return cur.fetchone()
+
+def claim_job_items(conn, job_id: int, statuses: List[str]) -> List[Tuple[str, datetime.date]]:
+    # Redone funds restart from fund_start, not from covered_start/covered_end: those are only written once a fund
+    # is done. A failed fund covers no contiguous range, because its missing lsjz pages can sit anywhere in the
+    # window, so the whole window is fetched again; rows already stored are not rewritten by MERGE_SQL.
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE public.fund_nav_job_item SET status = 'pending', attempts = attempts + 1
+            WHERE job_id = %s AND status = ANY(%s)
+            RETURNING fund_id, fund_start
+            """,
+            (job_id, statuses),
+        )
+        rows = cur.fetchall()
+        cur.execute("UPDATE public.fund_nav_job SET status = 'running' WHERE job_id = %s", (job_id,))
+    conn.commit()
+    return sorted(rows)
+
+def finish_job(conn, job_id: int) -> Dict[str, int]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT status, COUNT(*) FROM public.fund_nav_job_item WHERE job_id = %s GROUP BY status", (job_id,))
+        counts = dict(cur.fetchall())
+        if counts.get("pending"):
+            status = "running"
+        elif counts.get("failed"):
+            status = "failed"
+        else:
+            status = "done"
+        cur.execute("UPDATE public.fund_nav_job SET status = %s WHERE job_id = %s", (status, job_id))
+    conn.commit()
+    return counts
+
+# Only still-pending items are marked done, so a fund already failed by another chunk in this run stays failed.
+MARK_DONE_SQL = """
+UPDATE public.fund_nav_job_item i
+SET status = 'done', last_error = NULL, covered_start = i.fund_start, covered_end = j.end_date, rows_fetched = d.rows_fetched
+FROM unnest(%s::varchar[], %s::int[]) AS d(fund_id, rows_fetched), public.fund_nav_job j
+WHERE i.job_id = %s AND j.job_id = i.job_id AND i.fund_id = d.fund_id AND i.status = 'pending'
+"""
+
+MARK_FAILED_SQL = """
+UPDATE public.fund_nav_job_item i
+SET status = 'failed', last_error = f.error
+FROM unnest(%s::varchar[], %s::text[]) AS f(fund_id, error)
+WHERE i.job_id = %s AND i.fund_id = f.fund_id
+"""
+
+def record_progress(cur, job_id: int, done: List[Tuple[str, int]], failed: List[Tuple[str, str]]) -> None:
+    if done:
+        cur.execute(MARK_DONE_SQL, ([fid for fid, _ in done], [n for _, n in done], job_id))
+    if failed:
+        cur.execute(MARK_FAILED_SQL, ([fid for fid, _ in failed], [err for _, err in failed], job_id))
+
+def write_chunk(pool: WriterConnectionPool, job_id: int, rows: List[NavRow], done: List[Tuple[str, int]], failed: List[Tuple[str, str]]) -> int:
+    # Rows and the checkpoint of the funds they complete commit together.
+    wait_started = time.perf_counter()
+    with pool.connection() as conn:
+        started = time.perf_counter()
+        metrics.histogram("db_pool_wait_seconds", "Time waiting for a writer connection").observe(started - wait_started)
+        with conn.cursor() as cur:
+            changed = merge_rows(cur, rows)
+            record_progress(cur, job_id, done, failed)
+        conn.commit()
+    metrics.histogram("write_chunk_seconds", "COPY + merge + checkpoint + commit per chunk").observe(time.perf_counter() - started)
+    metrics.histogram("write_chunk_rows", "Rows per write chunk", buckets=(0, 100, 500, 1000, 2000, 5000, 10000)).observe(len(rows))
+    return changed
+
+async def fetch_one(fund_id: str, start_date: datetime.date, end_date: datetime.date) -> Tuple[str, List[dict], Optional[str]]:
+    started = time.perf_counter()
+    result = "ok"
     try:
-        return upsert_rows(conn, rows)
+        query = FundNavQuery(code=fund_id, start_date=start_date, end_date=end_date)
+        data = await get_fund_nav_raw_from_api(query)
+        return fund_id, data, None
+    except NavPartialError as e:
+        result = "partial"
+        # Keep the pages that arrived; the fund is still checkpointed as failed so --retry-failed revisits it.
+        return fund_id, e.data, f"缺页 {e.missing_pages}: {e}"
+    except Exception as e:
+        result = "error"
+        return fund_id, [], str(e)
     finally:
-        conn.close()
+        metrics.histogram("fund_fetch_seconds", "All pages of one fund, including retries and slot waits").observe(time.perf_counter() - started)
+        metrics.counter("funds_fetched_total", "Funds fetched", {"result": result}).inc()
+
+def load_archived_items(archive: RawArchive, fund_id: str, start_date: datetime.date,
+                        end_date: datetime.date) -> Tuple[List[dict], List[str]]:
+    """Archived items in [start_date, end_date] and the fetches whose missing pages no later fetch made up for."""
+    # Fetches are replayed in the order they were made, so a later value for the same date wins, as in the live run.
+    lo, hi = start_date.isoformat(), end_date.isoformat()
+    items_by_date: Dict[str, dict] = {}
+    gaps: List[Tuple[str, str, List[int]]] = []
+    for entry in archive.fetches(fund_id):
+        s, e = entry["start_date"] or lo, entry["end_date"] or hi
+        if s > hi or e < lo:
+            continue
+        if entry["missing_pages"]:
+            gaps.append((s, e, entry["missing_pages"]))
+        else:
+            gaps = [gap for gap in gaps if not (s <= gap[0] and gap[1] <= e)]
+        for body in archive.load_pages(entry["digest"]):
+            for item in (json.loads(body).get("Data") or {}).get("LSJZList") or []:
+                date_str = item.get("FSRQ")
+                if date_str and lo <= date_str <= hi:
+                    items_by_date[date_str] = item
+    return list(items_by_date.values()), [f"{s}~{e} 缺页 {pages}" for s, e, pages in gaps]
 
-async def upsert_rows_async(cfg: dict, rows: List[FundNavRow], semaphore: asyncio.Semaphore) -> int:
-    async with semaphore:
-        return await asyncio.to_thread(upsert_rows_with_new_conn, cfg, rows)
+async def replay_one(archive: RawArchive, fund_id: str, start_date: datetime.date, end_date: datetime.date) -> Tuple[str, List[dict], Optional[str]]:
+    try:
+        data, gaps = await asyncio.to_thread(load_archived_items, archive, fund_id, start_date, end_date)
+    except Exception as e:
+        return fund_id, [], str(e)
+    if gaps:
+        # Same as a partial live fetch: keep the rows, but checkpoint the fund as failed for --retry-failed.
+        return fund_id, data, f"缺页 (归档): {'; '.join(gaps)}"
+    return fund_id, data, None
 
-def chunk_rows(rows: List[FundNavRow], size: int) -> List[List[FundNavRow]]:
-    return [rows[i:i + size] for i in range(0, len(rows), size)]
+async def fetch_stage(windows, end_date: datetime.date, parse_queue: asyncio.Queue, fetch=fetch_one) -> None:
+    # Every fetcher pulls from the same iterator; put() blocks while the parser is behind.
+    for fund_id, fund_start in windows:
+        await parse_queue.put(await fetch(fund_id, fund_start, end_date))
+    await parse_queue.put(None)
+
+async def parse_stage(parse_queue: asyncio.Queue, write_queue: asyncio.Queue, fetchers: int, writers: int, write_chunk_size: int, checkpoint_every: int, strict: bool, stats: PipelineStats) -> None:
+    build = build_rows_strict if strict else build_rows
+    buffer: List[NavRow] = []
+    done: List[Tuple[str, int]] = []
+    failed: List[Tuple[str, str]] = []
+    finished = 0
+    while finished < fetchers:
+        item = await parse_queue.get()
+        if item is None:
+            finished += 1
+            continue
+        fund_id, data, err = item
+        stats.fetched_funds += 1
+        parse_started = time.perf_counter()
+        fund_rows = build(fund_id, data) if data else []
+        metrics.histogram("parse_seconds", "build_rows per fund").observe(time.perf_counter() - parse_started)
+        metrics.counter("rows_parsed_total", "Rows produced by the parser").inc(len(fund_rows))
+        buffer.extend(fund_rows)
+        if err:
+            stats.errors += 1
+            failed.append((fund_id, err))
+        else:
+            done.append((fund_id, len(fund_rows)))
+        while len(buffer) >= write_chunk_size:
+            chunk, buffer = buffer[:write_chunk_size], buffer[write_chunk_size:]
+            # Whatever is left in the buffer belongs to the last fund, whose checkpoint waits for its final chunk.
+            ready, done = (done, []) if not buffer else (done[:-1], done[-1:])
+            await write_queue.put((chunk, ready, failed))
+            failed = []
+        if stats.fetched_funds % checkpoint_every == 0 or stats.fetched_funds == stats.total_funds:
+            if done or failed:
+                await write_queue.put((buffer, done, failed))
+                buffer, done, failed = [], [], []
+            logging.info(f"fetch: {stats.fetched_funds}/{stats.total_funds} funds, errors {stats.errors}, parse_queue {parse_queue.qsize()}, write_queue {write_queue.qsize()}")
+    if buffer or done or failed:
+        await write_queue.put((buffer, done, failed))
+    for _ in range(writers):
+        await write_queue.put(None)
 
-async def fetch_one(fund_id: str, start_date: datetime.date, end_date: datetime.date, semaphore: asyncio.Semaphore) -> Tuple[str, List[dict], Optional[str]]:
-    async with semaphore:
+async def write_stage(pool: WriterConnectionPool, job_id: int, write_queue: asyncio.Queue, stats: PipelineStats) -> None:
+    while True:
+        item = await write_queue.get()
+        if item is None:
+            return
+        rows, done, failed = item
         try:
-            query = FundNavQuery(code=fund_id, start_date=start_date, end_date=end_date)
-            data = await get_fund_nav_raw_from_api(query)
-            return fund_id, data, None
+            written = await asyncio.to_thread(write_chunk, pool, job_id, rows, done, failed)
         except Exception as e:
-            return fund_id, [], str(e)
-
-async def fetch_batch_async(batch: List[str], start_date: datetime.date, end_date: datetime.date, concurrency: int) -> FetchBatchResult:
-    semaphore = asyncio.Semaphore(concurrency)
-    tasks = [fetch_one(fid, start_date, end_date, semaphore) for fid in batch]
-    results = await asyncio.gather(*tasks)
-    rows: List[FundNavRow] = []
-    errors = 0
-    updated_funds = 0
-    for fund_id, data, err in results:
-        if err:
-            errors += 1
+            stats.failed_writes += 1
+            logging.info(f"write failed: rows {len(rows)}, total_written {stats.written_rows}, reason {e}")
+            write_failed = sorted({fid for fid, _ in done} | {row[0] for row in rows})
+            try:
+                await asyncio.to_thread(write_chunk, pool, job_id, [], [], failed + [(fid, f"写入失败: {e}") for fid in write_failed])
+            except Exception as checkpoint_error:
+                logging.info(f"checkpoint failed: funds {len(write_failed) + len(failed)}, reason {checkpoint_error}")
             continue
-        fund_rows = build_rows(fund_id, data)
-        if fund_rows:
-            updated_funds += 1
-            rows.extend(fund_rows)
-    return FetchBatchResult(rows=rows, errors=errors, updated_funds=updated_funds)
+        stats.written_rows += written
+        stats.updated_funds += sum(1 for _, n in done if n)
+        logging.info(f"after_write: rows={len(rows)}, cumulative_updated_funds={stats.updated_funds}, cumulative_written_rows={stats.written_rows}, errors={stats.errors}")
 
-def fetch_batch_worker(batch: List[str], start_date: datetime.date, end_date: datetime.date, concurrency: int) -> FetchBatchResult:
-    return asyncio.run(fetch_batch_async(batch, start_date, end_date, concurrency))
+async def sample_pipeline(parse_queue: asyncio.Queue, write_queue: asyncio.Queue, pool: WriterConnectionPool, interval: float = 1.0) -> None:
+    while True:
+        metrics.gauge("parse_queue_depth", "Fetched funds waiting for the parser").set(parse_queue.qsize())
+        metrics.gauge("write_queue_depth", "Row chunks waiting for a writer").set(write_queue.qsize())
+        metrics.gauge("db_connections_in_use", "Writer connections checked out").set(pool.in_use)
+        metrics.gauge("upstream_inflight_sampled", "In-flight lsjz requests, sampled every second").set(nav_limiter.inflight)
+        await asyncio.sleep(interval)
 
-async def write_rows_async(cfg: dict, rows: List[FundNavRow], write_concurrency: int, write_chunk_size: int) -> int:
-    write_semaphore = asyncio.Semaphore(write_concurrency)
-    row_chunks = chunk_rows(rows, write_chunk_size)
-    inserted_parts = await asyncio.gather(*[upsert_rows_async(cfg, chunk, write_semaphore) for chunk in row_chunks])
-    return sum(inserted_parts)
+def log_metrics_summary() -> None:
+    summary = metrics.to_json()
+    for name in ("upstream_request_seconds{outcome=\"ok\"}", "fund_fetch_seconds", "fund_pages", "parse_seconds", "write_chunk_seconds", "db_pool_wait_seconds"):
+        stat = summary.get(metrics.prefix + name)
+        if stat:
+            logging.info(f"metrics {name}: count={stat['count']}, total={stat['sum']:.2f}, mean={stat['mean']:.4f}, p50<={stat['p50']}, p95<={stat['p95']}, max={stat['max']:.4f}")
+    for name in ("parse_queue_depth", "write_queue_depth", "db_connections_in_use", "upstream_inflight_sampled"):
+        stat = summary.get(metrics.prefix + name)
+        if stat:
+            logging.info(f"metrics {name}: mean={stat['mean']:.1f}, max={stat['max']:.0f}")
 
-def write_rows_worker(cfg: dict, rows: List[FundNavRow], write_concurrency: int, write_chunk_size: int) -> int:
-    return asyncio.run(write_rows_async(cfg, rows, write_concurrency, write_chunk_size))
+async def run_pipeline(windows: List[Tuple[str, datetime.date]], end_date: datetime.date, pool: WriterConnectionPool, job_id: int, args, stats: PipelineStats, fetch=fetch_one) -> None:
+    """fetch -> parse -> write over bounded queues: a slow database fills write_queue, which stalls the parser,
+    which fills parse_queue, which stalls the fetchers. In-memory rows stay bounded by the queue sizes."""
+    fetchers = max(1, min(args.concurrency, len(windows)))
+    writers = max(1, args.write_concurrency)
+    parse_queue: asyncio.Queue = asyncio.Queue(maxsize=fetchers)
+    write_queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, args.queue_size))
+    window_iter = iter(windows)
+    await open_nav_client()
+    sampler = asyncio.create_task(sample_pipeline(parse_queue, write_queue, pool))
+    try:
+        await asyncio.gather(
+            *[fetch_stage(window_iter, end_date, parse_queue, fetch) for _ in range(fetchers)],
+            parse_stage(parse_queue, write_queue, fetchers, writers, args.write_chunk_size, max(1, args.batch_size), args.strict, stats),
+            *[write_stage(pool, job_id, write_queue, stats) for _ in range(writers)],
+        )
+    finally:
+        sampler.cancel()
+        await close_nav_client()
 
 def parse_args():
     p = argparse.ArgumentParser()
     p.add_argument("--config", default=None, help="YAML 配置文件路径，默认 eastmoney/config.yaml")
     p.add_argument("--start-date", default=f"{dt.date.today() - dt.timedelta(days=7)}")
     p.add_argument("--end-date", default=f"{dt.date.today()}")
-    p.add_argument("--batch-size", type=int, default=200)
-    p.add_argument("--concurrency", type=int, default=20)
+    p.add_argument("--batch-size", type=int, default=200, help="每抓取多少只基金打印一次进度并提交检查点")
+    p.add_argument("--concurrency", type=int, default=64, help="同时抓取的基金数（全局）")
+    p.add_argument("--initial-inflight", type=int, default=8, help="全局在途请求数的初始值，之后按 AIMD 自动调整")
+    p.add_argument("--min-inflight", type=int, default=2)
+    p.add_argument("--max-inflight", type=int, default=64)
     p.add_argument("--write-concurrency", type=int, default=5)
     p.add_argument("--write-chunk-size", type=int, default=2000)
-    p.add_argument("--workers", type=int, default=6)
+    p.add_argument("--queue-size", type=int, default=10, help="待写入队列最多缓存的写入块数，满了会反压抓取")
+    p.add_argument("--synchronous-commit", default="off", choices=["on", "off", "local", "remote_write", "remote_apply"], help="写入连接的 synchronous_commit 会话设置")
+    p.add_argument("--incremental", action="store_true", help="按每只基金已入库的最新 nav_date 续抓，已是最新的基金跳过")
+    p.add_argument("--schedule", action="store_true", help="与 --incremental 一起使用：按各基金的公布频率与延迟只抓取预计已有新净值的基金")
+    p.add_argument("--schedule-lookback-days", type=int, default=180, help="推断公布频率、延迟和交易日历时回看的天数")
+    p.add_argument("--max-backoff-days", type=int, default=30, help="抓取为空后重试间隔按 1、2、4… 天递增的上限，也是休眠基金的探测间隔")
+    p.add_argument("--dormant-days", type=int, default=90, help="最新净值距今超过该天数的基金视为休眠，仅按 --max-backoff-days 间隔探测")
+    p.add_argument("--strict", action="store_true", help="解析时用 Pydantic 模型逐行校验（较慢）")
+    p.add_argument("--archive-dir", default=None, help="原始响应归档目录：抓取时把每只基金的 lsjz 原始响应压缩存档，配合 --replay 离线重放")
+    p.add_argument("--replay", action="store_true", help="不访问网络，从 --archive-dir 的归档重建净值")
+    p.add_argument("--metrics-file", default=None, help="运行结束时把各阶段指标写入该文件")
+    p.add_argument("--metrics-format", default="prometheus", choices=["prometheus", "json"], help="Prometheus 文本格式或 JSON 摘要")
+    p.add_argument("--profile", default=None, help="开启采样分析器，把折叠栈（flamegraph/speedscope 可读）写入该文件")
+    p.add_argument("--profile-interval", type=float, default=0.005, help="采样间隔（秒）")
+    p.add_argument("--resume", action="store_true", help="续跑最近一个未完成的任务，只抓取尚未完成的基金")
+    p.add_argument("--retry-failed", action="store_true", help="重抓最近一个未完成任务中失败的基金，可与 --resume 同时使用")
+    p.add_argument("--job-id", type=int, default=None, help="配合 --resume/--retry-failed 指定任务，默认最近一个未完成的任务")
     return p.parse_args()
 
 def main():
@@ -194,68 +699,73 @@ def main():
     cfg = load_yaml_config(args.config)
     start_date = datetime.date.fromisoformat(args.start_date)
     end_date = datetime.date.fromisoformat(args.end_date)
-    total_inserted = 0
-    total_updated_funds = 0
-    errors = 0
+    stats = PipelineStats()
+    nav_limiter.configure(args.initial_inflight, args.min_inflight, args.max_inflight)
+    if args.replay and not args.archive_dir:
+        raise SystemExit("--replay 需要同时指定 --archive-dir")
+    if args.schedule and not args.incremental:
+        raise SystemExit("--schedule 需要与 --incremental 一起使用")
+    archive = RawArchive(args.archive_dir) if args.archive_dir else None
+    if archive is not None and not args.replay:
+        set_nav_archive(archive)
+    fetch = partial(replay_one, archive) if args.replay else fetch_one
+    job_id = None
+    profiler = SamplingProfiler(args.profile_interval) if args.profile else None
+    if profiler is not None:
+        profiler.start()
     conn = get_conn(cfg)
+    write_pool = WriterConnectionPool(cfg, args.write_concurrency, synchronous_commit=args.synchronous_commit)
     try:
         ensure_schema(conn)
-        fund_ids = fetch_fund_ids(conn)
-        fetch_batches = [
-            fund_ids[i:i + args.batch_size]
-            for i in range(0, len(fund_ids), args.batch_size)
-        ]
-        with ThreadPoolExecutor(max_workers=args.workers) as worker_pool:
-            lock = threading.Lock()
-            write_future_to_meta = {}
-
-            def on_fetch_done(fetch_future, batch_idx: int, batch_size: int):
-                nonlocal errors
-                try:
-                    fetch_result = fetch_future.result()
-                except Exception as e:
-                    with lock:
-                        errors += batch_size
-                    logging.info(f"batch {batch_idx}: fetch failed, fetched {batch_size}, rows 0, total_inserted {total_inserted}, errors {errors}, reason {e}")
-                    return
-                rows = fetch_result.rows
-                batch_errors = fetch_result.errors
-                updated_funds = fetch_result.updated_funds
-                with lock:
-                    errors += batch_errors
-                logging.info(f"batch {batch_idx}: write preview rows={rows[:1]}")
-                write_future = worker_pool.submit(write_rows_worker, cfg, rows, args.write_concurrency, args.write_chunk_size)
-                with lock:
-                    write_future_to_meta[write_future] = WriteTaskMeta(
-                        batch_idx=batch_idx,
-                        batch_size=batch_size,
-                        row_count=len(rows),
-                        updated_funds=updated_funds,
-                    )
-
-            fetch_futures = []
-            for idx, batch in enumerate(fetch_batches, start=1):
-                fetch_future = worker_pool.submit(fetch_batch_worker, batch, start_date, end_date, args.concurrency)
-                fetch_future.add_done_callback(lambda f, batch_idx=idx, batch_size=len(batch): on_fetch_done(f, batch_idx, batch_size))
-                fetch_futures.append(fetch_future)
-
-            wait(fetch_futures)
-
-            write_futures = list(write_future_to_meta.keys())
-            for write_future in as_completed(write_futures):
-                meta = write_future_to_meta[write_future]
-                try:
-                    inserted = write_future.result()
-                except Exception as e:
-                    logging.info(f"batch {meta.batch_idx}: write failed, fetched {meta.batch_size}, rows {meta.row_count}, total_inserted {total_inserted}, errors {errors}, reason {e}")
-                    continue
-                total_inserted += inserted
-                total_updated_funds += meta.updated_funds
-                logging.info(f"batch {meta.batch_idx}: fetched {meta.batch_size}, rows {meta.row_count}, total_inserted {total_inserted}, errors {errors}")
-                logging.info(f"after_write: cumulative_updated_funds={total_updated_funds}, cumulative_written_rows={total_inserted}, errors={errors}")
+        if args.resume or args.retry_failed:
+            job = find_job(conn, args.job_id)
+            if job is None:
+                raise SystemExit("没有找到可续跑的任务")
+            job_id, start_date, end_date, _ = job
+            statuses = (["pending"] if args.resume else []) + (["failed"] if args.retry_failed else [])
+            windows = claim_job_items(conn, job_id, statuses)
+            logging.info(f"job {job_id}: redo {statuses} funds={len(windows)}, range={start_date}~{end_date}")
+        else:
+            fund_ids = archive.fund_ids() if args.replay else fetch_fund_ids(conn)
+            watermarks = fetch_nav_watermarks(conn) if args.incremental else None
+            windows = plan_fetch_windows(fund_ids, start_date, end_date, watermarks)
+            if args.incremental:
+                logging.info(f"incremental: funds={len(fund_ids)}, with_watermark={len(watermarks)}, to_fetch={len(windows)}, skipped={len(fund_ids) - len(windows)}")
+                if args.schedule:
+                    windows = schedule_fetch_windows(conn, windows, watermarks, end_date, args)
+            job_id = create_job(conn, start_date, end_date, args.incremental, windows)
+            windows = claim_job_items(conn, job_id, ["pending"])
+            logging.info(f"job {job_id}: funds={len(windows)}, range={start_date}~{end_date}")
+        stats.total_funds = len(windows)
+        if not is_partitioned(conn):
+            logging.info("fund_nav_daily is not partitioned yet, run migrate_fund_nav_daily.py to convert it")
+        elif windows:
+            logging.info(f"partitions: created={ensure_partitions(conn, start_date, end_date)}, range={start_date.year}~{end_date.year}")
+        if windows:
+            asyncio.run(run_pipeline(windows, end_date, write_pool, job_id, args, stats, fetch))
     finally:
-        logging.info(f"done: cumulative_updated_funds={total_updated_funds}, cumulative_written_rows={total_inserted}, errors={errors}")
+        if job_id is not None:
+            try:
+                counts = finish_job(conn, job_id)
+                logging.info(f"job {job_id}: {counts}")
+            except psycopg2.Error as e:
+                logging.info(f"job {job_id}: status update failed, reason {e}")
+        logging.info(f"done: cumulative_updated_funds={stats.updated_funds}, cumulative_written_rows={stats.written_rows}, errors={stats.errors}, failed_writes={stats.failed_writes}")
+        nav_limiter.log()
+        logging.info(f"nav limiter: final_limit={nav_limiter.limit:.1f}, totals={nav_limiter.totals}")
+        logging.info(f"write pool: size={write_pool.size}, connections_created={write_pool.created}, connections_discarded={write_pool.discarded}")
+        write_pool.close()
         conn.close()
+        log_metrics_summary()
+        if args.metrics_file:
+            metrics.write(args.metrics_file, args.metrics_format)
+            logging.info(f"metrics written to {args.metrics_file} ({args.metrics_format})")
+        if profiler is not None:
+            profiler.stop()
+            profiler.write_collapsed(args.profile)
+            logging.info(f"profile: samples={profiler.samples}, written to {args.profile}")
+            for label, count in profiler.top_functions(10):
+                logging.info(f"profile {count / max(1, profiler.samples):6.1%} {label}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+logger = logging.getLogger("eastmoney.aimd")
+
+OK = "ok"
+THROTTLED = "throttled"
+ERROR = "error"
+
+
+class AimdLimiter:
+    """Process-wide in-flight limit tuned by additive increase / multiplicative decrease.
+
+    Every successful request within the latency tolerance adds ``1 / limit`` (about +1 per round trip of the
+    whole window); a throttle, error or latency spike multiplies the limit down, at most once per ``cooldown``
+    so a burst of failures from one congestion event counts once.
+    """
+
+    def __init__(self, initial: int = 8, min_limit: int = 1, max_limit: int = 64, backoff: float = 0.5,
+                 latency_backoff: float = 0.9, latency_tolerance: float = 3.0, cooldown: float = 1.0,
+                 log_interval: float = 10.0):
+        self.configure(initial, min_limit, max_limit)
+        self.backoff = backoff
+        self.latency_backoff = latency_backoff
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.log_interval = log_interval
+        self._inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._started = time.monotonic()
+        self._last_log = self._started
+        self._window = [0, 0, 0, 0.0]
+        self.totals = {OK: 0, THROTTLED: 0, ERROR: 0}
+        self.history: List[Tuple[float, float]] = []
+
+    def configure(self, initial: int, min_limit: int, max_limit: int) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def _has_room(self) -> bool:
+        return self._inflight < int(self.limit)
+
+    def _wake(self) -> None:
+        while self._waiters and self._has_room():
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self._inflight += 1
+            future.set_result(None)
+
+    async def acquire(self) -> None:
+        if not self._waiters and self._has_room():
+            self._inflight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(None, None)
+            raise
+
+    def release(self, latency: Optional[float], outcome: Optional[str]) -> None:
+        """Give the slot back; ``outcome`` None (e.g. cancellation) frees it without adjusting the limit."""
+        self._inflight -= 1
+        if outcome is not None:
+            self._adjust(latency, outcome)
+        self._wake()
+
+    def _decrease(self, now: float, factor: float) -> None:
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * factor)
+
+    def _adjust(self, latency: float, outcome: str) -> None:
+        now = time.monotonic()
+        self.totals[outcome] += 1
+        window = self._window
+        if outcome == OK:
+            window[0] += 1
+            window[3] += latency
+            # Slowly drifting minimum: tracks the uncongested round trip without chasing spikes.
+            self._baseline = latency if self._baseline is None else min(latency, self._baseline * 0.99 + latency * 0.01)
+            if latency > self._baseline * self.latency_tolerance:
+                self._decrease(now, self.latency_backoff)
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+        elif outcome == THROTTLED:
+            window[1] += 1
+            self._decrease(now, self.backoff)
+        else:
+            window[2] += 1
+            self._decrease(now, self.backoff)
+        if now - self._last_log >= self.log_interval:
+            self.log(now)
+
+    def log(self, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        ok, throttled, errors, latency_sum = self._window
+        avg_ms = latency_sum / ok * 1000 if ok else 0.0
+        self.history.append((round(now - self._started, 1), round(self.limit, 1)))
+        logger.info(f"nav limiter: limit={self.limit:.1f}, inflight={self._inflight}, waiting={len(self._waiters)}, ok={ok}, throttled={throttled}, errors={errors}, avg_latency_ms={avg_ms:.0f}")
+        self._window = [0, 0, 0, 0.0]
+        self._last_log = now
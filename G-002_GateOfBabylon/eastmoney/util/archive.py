@@ -0,0 +1,86 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, Iterator, List
+
+
+class RawArchive:
+    """Local archive of raw lsjz responses.
+
+    Each fetch (all pages of one fund over one window) is stored once as a gzip blob named by the sha256 of its
+    content, so identical re-fetches cost no extra space; ``manifests/<fund_id>.jsonl`` lists the fetches of a
+    fund in the order they happened.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.manifests_dir = os.path.join(root, "manifests")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.gz")
+
+    def put_pages(self, bodies: List[bytes]) -> str:
+        # Length-prefixed frames keep page bodies byte-exact without escaping.
+        blob = b"".join(b"%d\n%s" % (len(body), body) for body in bodies)
+        digest = hashlib.sha256(blob).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(gzip.compress(blob, compresslevel=6))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return digest
+
+    def load_pages(self, digest: str) -> List[bytes]:
+        with open(self._object_path(digest), "rb") as f:
+            blob = gzip.decompress(f.read())
+        bodies = []
+        pos = 0
+        while pos < len(blob):
+            newline = blob.index(b"\n", pos)
+            size = int(blob[pos:newline])
+            bodies.append(blob[newline + 1:newline + 1 + size])
+            pos = newline + 1 + size
+        return bodies
+
+    def store_fetch(self, fund_id: str, start_date: str, end_date: str, page_size: int, total_count: int,
+                    bodies: List[bytes], missing_pages: List[int]) -> str:
+        digest = self.put_pages(bodies)
+        entry = {
+            "fund_id": fund_id,
+            "start_date": start_date,
+            "end_date": end_date,
+            "page_size": page_size,
+            "total_count": total_count,
+            "pages": len(bodies),
+            "missing_pages": missing_pages,
+            "digest": digest,
+            "fetched_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        }
+        with open(os.path.join(self.manifests_dir, f"{fund_id}.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return digest
+
+    def fund_ids(self) -> List[str]:
+        return sorted(name[:-len(".jsonl")] for name in os.listdir(self.manifests_dir) if name.endswith(".jsonl"))
+
+    def fetches(self, fund_id: str) -> Iterator[Dict[str, Any]]:
+        path = os.path.join(self.manifests_dir, f"{fund_id}.jsonl")
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
@@ -2,30 +2,42 @@ import asyncio
 import datetime
 import json
 import math
+import os
+import random
 import re
-from typing import Dict, List, Tuple, Any, Optional
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import httpx
 from pydantic import BaseModel
 
-RANK_URL = "http://fund.eastmoney.com/data/rankhandler.aspx?op=ph&dt=kf&ft={ft}&rs=&gs=0&sc=zzf&st=desc&pi=1&pn=30000&dx=1"
+from util.aimd import ERROR, OK, THROTTLED, AimdLimiter
+from util.archive import RawArchive
+from util.metrics import COUNT_BUCKETS, metrics
+
+# Both endpoints can be pointed elsewhere (e.g. bench/fake_eastmoney.py) through the environment.
+RANK_URL = os.environ.get("EASTMONEY_RANK_URL") or "http://fund.eastmoney.com/data/rankhandler.aspx?op=ph&dt=kf&ft={ft}&rs=&gs=0&sc=zzf&st=desc&pi=1&pn=30000&dx=1"
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
     "Referer": "https://fund.eastmoney.com/fund.html",
 }
 
-NAV_BASE_URL = "https://api.fund.eastmoney.com/f10/lsjz"
+NAV_BASE_URL = os.environ.get("EASTMONEY_NAV_URL") or "https://api.fund.eastmoney.com/f10/lsjz"
 NAV_HEADERS = {
     "Referer": "https://fundf10.eastmoney.com/",
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Host": "api.fund.eastmoney.com"
 }
+if not os.environ.get("EASTMONEY_NAV_URL"):
+    NAV_HEADERS["Host"] = "api.fund.eastmoney.com"
 class FundNavQuery(BaseModel):
     code: str
     start_date: Optional[datetime.date] = None
     end_date: Optional[datetime.date] = None
     page_size: int = 20
     max_concurrency: int = 20
+    max_retries: int = 3
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 8.0
 
 class FundNavValue(BaseModel):
     net_asset_value: Optional[str] = None
@@ -48,57 +60,175 @@ def pick_name(fields: List[str]) -> str:
             return v
     return fields[1]
 
-async def fetch_pairs(client: httpx.AsyncClient, ft: str) -> List[Tuple[str, str]]:
+class RankDataParser:
+    """Incrementally extracts the quoted items of ``datas:[...]`` from a rankhandler payload fed in chunks."""
+
+    MARKER = "datas:["
+
+    def __init__(self):
+        self._buf = ""
+        self._inside = False
+        self.done = False
+
+    def feed(self, text: str) -> List[str]:
+        if self.done:
+            return []
+        buf = self._buf + text
+        items: List[str] = []
+        if not self._inside:
+            idx = buf.find(self.MARKER)
+            if idx < 0:
+                self._buf = buf[-(len(self.MARKER) - 1):]
+                return items
+            buf = buf[idx + len(self.MARKER):]
+            self._inside = True
+        pos = 0
+        size = len(buf)
+        while pos < size:
+            ch = buf[pos]
+            if ch == "]":
+                self.done = True
+                pos = size
+                break
+            if ch != '"':
+                pos += 1
+                continue
+            end = buf.find('"', pos + 1)
+            while end > 0 and buf[end - 1] == "\\":
+                end = buf.find('"', end + 1)
+            if end < 0:
+                break
+            raw = buf[pos:end + 1]
+            try:
+                items.append(json.loads(raw))
+            except ValueError:
+                items.append(raw[1:-1])
+            pos = end + 1
+        self._buf = buf[pos:]
+        return items
+
+def _pair_from_item(item: str) -> Optional[Tuple[str, str]]:
+    parts = item.split(",")
+    code = parts[0]
+    name = pick_name(parts)
+    if code and name:
+        return code, name
+    return None
+
+async def stream_pairs(client: httpx.AsyncClient, ft: str) -> AsyncIterator[Tuple[str, str]]:
     url = RANK_URL.format(ft=ft)
-    r = await client.get(url, headers=HEADERS, timeout=30)
-    r.raise_for_status()
-    content = r.text
-    m = re.search(r"datas:\[(.*?)\]", content, re.DOTALL)
-    if not m:
-        return []
-    ds = m.group(1)
-    try:
-        arr = json.loads(f"[{ds}]")
-    except json.JSONDecodeError:
-        arr = re.findall(r'"(.*?)"', ds)
-    out: List[Tuple[str, str]] = []
-    for item in arr:
-        parts = item.split(",")
-        if not parts:
-            continue
-        code = parts[0]
-        name = pick_name(parts)
-        if code and name:
-            out.append((code, name))
-    return out
+    parser = RankDataParser()
+    async with client.stream("GET", url, headers=HEADERS, timeout=30) as r:
+        r.raise_for_status()
+        async for chunk in r.aiter_text():
+            for item in parser.feed(chunk):
+                pair = _pair_from_item(item)
+                if pair:
+                    yield pair
+            if parser.done:
+                break
+
+async def fetch_pairs(client: httpx.AsyncClient, ft: str) -> List[Tuple[str, str]]:
+    return [pair async for pair in stream_pairs(client, ft)]
+
+RANK_FUND_TYPES = ["gp", "hh", "zq", "zs", "qdii", "lof", "fof"]
+
+async def collect_all_pairs() -> Tuple[Dict[str, str], List[str]]:
+    """Returns code -> name over every fund type, plus the fund types whose download failed.
+
+    A code listed under several types keeps the name from the first type in RANK_FUND_TYPES, as before. A type
+    whose download fails partway contributes nothing, not the part that arrived.
+    """
+    names: Dict[str, str] = {}
+    priority: Dict[str, int] = {}
+
+    async def consume(client: httpx.AsyncClient, rank: int, ft: str) -> None:
+        pairs = await fetch_pairs(client, ft)
+        for code, name in pairs:
+            if priority.get(code, len(RANK_FUND_TYPES) + 1) > rank:
+                priority[code] = rank
+                names[code] = name
 
-async def fetch_all_pairs() -> Dict[str, str]:
-    fts = ["gp", "hh", "zq", "zs", "qdii", "lof", "fof"]
     async with httpx.AsyncClient() as client:
-        results = await asyncio.gather(*(fetch_pairs(client, ft) for ft in fts), return_exceptions=True)
-    data: Dict[str, str] = {}
-    for r in results:
-        if isinstance(r, Exception):
-            continue
-        for code, name in r:
-            if code not in data:
-                data[code] = name
-    if not data:
-        async with httpx.AsyncClient() as client:
-            fallback = await fetch_pairs(client, "all")
-        for code, name in fallback:
-            if code not in data:
-                data[code] = name
-    return data
+        results = await asyncio.gather(
+            *(consume(client, rank, ft) for rank, ft in enumerate(RANK_FUND_TYPES)), return_exceptions=True
+        )
+        failed = [ft for ft, r in zip(RANK_FUND_TYPES, results) if isinstance(r, Exception)]
+        if not names:
+            await consume(client, len(RANK_FUND_TYPES), "all")
+            failed = []
+    return names, failed
 
-async def _fetch_nav_page(
-    client: httpx.AsyncClient,
-    semaphore: asyncio.Semaphore,
-    query: FundNavQuery,
-    page: int,
-    s_date: str,
-    e_date: str,
-) -> Dict[str, Any]:
+async def fetch_all_pairs() -> Dict[str, str]:
+    names, _ = await collect_all_pairs()
+    return names
+
+# Throttling and transient server errors; anything else (4xx, ErrCode != 0) will not succeed on retry.
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# Statuses that mean "slow down" rather than "something broke".
+THROTTLE_STATUS = {429, 503}
+
+# Shared by every fund and page in the process; seed_fund_nav_daily.py configures its bounds.
+nav_limiter = AimdLimiter()
+# When set, every lsjz fetch is also written to this archive as raw response bodies.
+nav_archive: Optional[RawArchive] = None
+
+def set_nav_archive(archive: Optional[RawArchive]) -> None:
+    global nav_archive
+    nav_archive = archive
+
+# The pipeline opens one client for all its fetches: building an AsyncClient creates a fresh SSL context, which
+# costs more CPU than a whole incremental fetch. Connections are not capped here (nav_limiter decides how many
+# requests are in flight), but few are kept alive: httpcore checks every pooled connection on each request.
+_nav_client: Optional[httpx.AsyncClient] = None
+_nav_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _new_nav_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=10.0, headers=NAV_HEADERS,
+        limits=httpx.Limits(max_connections=None, max_keepalive_connections=16),
+    )
+
+async def open_nav_client() -> httpx.AsyncClient:
+    """Share one client across lsjz fetches on the running loop until close_nav_client(); the caller owns it."""
+    global _nav_client, _nav_client_loop
+    loop = asyncio.get_running_loop()
+    if _nav_client is None or _nav_client.is_closed or _nav_client_loop is not loop:
+        _nav_client = _new_nav_client()
+        _nav_client_loop = loop
+    return _nav_client
+
+async def close_nav_client() -> None:
+    global _nav_client, _nav_client_loop
+    if _nav_client is not None:
+        await _nav_client.aclose()
+    _nav_client = None
+    _nav_client_loop = None
+
+def _active_nav_client() -> Optional[httpx.AsyncClient]:
+    if _nav_client is not None and not _nav_client.is_closed and _nav_client_loop is asyncio.get_running_loop():
+        return _nav_client
+    return None
+
+class NavPageError(ValueError):
+    def __init__(self, message: str, retryable: bool, throttled: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+        self.throttled = throttled
+
+class NavPartialError(ValueError):
+    """Some pages are still missing after retries; ``data`` holds every page that did arrive."""
+
+    def __init__(self, data: List[Dict[str, Any]], missing_pages: List[int], errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.data = data
+        self.missing_pages = missing_pages
+
+def _backoff_delay(query: FundNavQuery, attempt: int) -> float:
+    # Full jitter: spreads retries of pages that failed together instead of re-synchronising them.
+    return random.uniform(0, min(query.retry_max_delay, query.retry_base_delay * (2 ** attempt)))
+
+async def _request_nav_page(client: httpx.AsyncClient, query: FundNavQuery, page: int, s_date: str, e_date: str, raw_pages: Optional[Dict[int, bytes]] = None) -> Dict[str, Any]:
     params = {
         "fundCode": query.code,
         "pageIndex": page,
@@ -106,70 +236,116 @@ async def _fetch_nav_page(
         "startDate": s_date,
         "endDate": e_date,
     }
-    async with semaphore:
+    try:
         response = await client.get(NAV_BASE_URL, params=params, headers=NAV_HEADERS)
         response.raise_for_status()
-        try:
-            data = response.json()
-        except ValueError as e:
-            raise ValueError(f"响应数据不是有效的JSON: {e}")
-        err_code = data.get("ErrCode")
-        if err_code is not None and err_code != 0:
-            err_msg = data.get("ErrMsg", "未知错误")
-            raise ValueError(f"API返回错误 (第{page}页): {err_msg} (错误码: {err_code})")
+    except httpx.HTTPStatusError as e:
+        status = e.response.status_code
+        raise NavPageError(f"网络请求失败: {e}", retryable=status in RETRYABLE_STATUS, throttled=status in THROTTLE_STATUS)
+    except httpx.TimeoutException as e:
+        raise NavPageError(f"网络请求失败: {e}", retryable=True, throttled=True)
+    except httpx.HTTPError as e:
+        raise NavPageError(f"网络请求失败: {e}", retryable=True)
+    try:
+        data = response.json()
+    except ValueError as e:
+        raise NavPageError(f"响应数据不是有效的JSON: {e}", retryable=True)
+    err_code = data.get("ErrCode")
+    if err_code is not None and err_code != 0:
+        err_msg = data.get("ErrMsg", "未知错误")
+        raise NavPageError(f"API返回错误 (第{page}页): {err_msg} (错误码: {err_code})", retryable=False)
+    if raw_pages is not None:
+        raw_pages[page] = response.content
+    return data
+
+async def _limited_request(client: httpx.AsyncClient, query: FundNavQuery, page: int, s_date: str, e_date: str, raw_pages: Optional[Dict[int, bytes]] = None) -> Dict[str, Any]:
+    wait_started = time.monotonic()
+    await nav_limiter.acquire()
+    started = time.monotonic()
+    metrics.histogram("upstream_queue_wait_seconds", "Time spent waiting for an in-flight slot").observe(started - wait_started)
+    metrics.gauge("upstream_inflight", "In-flight lsjz requests").set(nav_limiter.inflight)
+    outcome = None
+    try:
+        data = await _request_nav_page(client, query, page, s_date, e_date, raw_pages)
+        outcome = OK
         return data
+    except NavPageError as e:
+        # A permanent API error is still a timely answer, so it does not count against the limit.
+        outcome = THROTTLED if e.throttled else (ERROR if e.retryable else OK)
+        raise
+    finally:
+        latency = time.monotonic() - started
+        nav_limiter.release(latency, outcome)
+        label = {"outcome": outcome or "cancelled"}
+        metrics.histogram("upstream_request_seconds", "lsjz request latency", label).observe(latency)
+        metrics.counter("upstream_requests_total", "lsjz requests", label).inc()
+        metrics.gauge("upstream_limit", "AIMD in-flight limit").set(nav_limiter.limit)
 
-async def _collect_nav_list(query: FundNavQuery) -> List[Dict[str, Any]]:
+async def _fetch_nav_page(
+    client: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    query: FundNavQuery,
+    page: int,
+    s_date: str,
+    e_date: str,
+    raw_pages: Optional[Dict[int, bytes]] = None,
+) -> Dict[str, Any]:
+    attempt = 0
+    while True:
+        try:
+            async with semaphore:
+                return await _limited_request(client, query, page, s_date, e_date, raw_pages)
+        except NavPageError as e:
+            if not e.retryable or attempt >= query.max_retries:
+                raise
+        await asyncio.sleep(_backoff_delay(query, attempt))
+        attempt += 1
+
+async def _collect_nav_list(query: FundNavQuery, client: Optional[httpx.AsyncClient] = None) -> List[Dict[str, Any]]:
+    # Without a client from the caller or an open shared one, use a client of our own for this fetch only.
+    client = client or _active_nav_client()
+    if client is not None:
+        return await _collect_nav_list_with(client, query)
+    async with _new_nav_client() as own_client:
+        return await _collect_nav_list_with(own_client, query)
+
+async def _collect_nav_list_with(client: httpx.AsyncClient, query: FundNavQuery) -> List[Dict[str, Any]]:
     s_date = query.start_date.strftime("%Y-%m-%d") if query.start_date else ""
     e_date = query.end_date.strftime("%Y-%m-%d") if query.end_date else ""
-    async with httpx.AsyncClient(timeout=10.0, headers=NAV_HEADERS) as client:
-        try:
-            first_params = {
-                "fundCode": query.code,
-                "pageIndex": 1,
-                "pageSize": query.page_size,
-                "startDate": s_date,
-                "endDate": e_date,
-            }
-            first_response = await client.get(NAV_BASE_URL, params=first_params)
-            first_response.raise_for_status()
-            try:
-                first_data = first_response.json()
-            except ValueError as e:
-                raise ValueError(f"响应数据不是有效的JSON: {e}")
-            err_code = first_data.get("ErrCode")
-            err_msg = first_data.get("ErrMsg", "")
-            if err_code is not None and err_code != 0:
-                raise ValueError(f"API返回错误: {err_msg} (错误码: {err_code})")
-            total_count = first_data.get("TotalCount", 0)
-            if total_count == 0:
-                return []
-            total_pages = math.ceil(total_count / query.page_size) if total_count else 0
-            all_data: List[Dict[str, Any]] = []
-            all_data.extend(first_data.get("Data", {}).get("LSJZList") or [])
-            if total_pages > 1:
-                semaphore = asyncio.Semaphore(query.max_concurrency)
-                tasks = [
-                    _fetch_nav_page(client, semaphore, query, page, s_date, e_date)
-                    for page in range(2, total_pages + 1)
-                ]
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                page_errors = []
-                for result in results:
-                    if isinstance(result, Exception):
-                        page_errors.append(str(result))
-                        continue
-                    all_data.extend(result.get("Data", {}).get("LSJZList") or [])
-                if page_errors:
-                    raise ValueError("; ".join(page_errors))
-            if not all_data:
-                raise ValueError("No data found.")
-            return all_data
-        except httpx.HTTPError as e:
-            raise ValueError(f"网络请求失败: {e}")
-
-async def get_fund_nav_data_from_api(query: FundNavQuery) -> FundNavResult:
-    all_data = await _collect_nav_list(query)
+    semaphore = asyncio.Semaphore(query.max_concurrency)
+    archive = nav_archive
+    raw_pages: Optional[Dict[int, bytes]] = {} if archive is not None else None
+    first_data = await _fetch_nav_page(client, semaphore, query, 1, s_date, e_date, raw_pages)
+    total_count = first_data.get("TotalCount", 0)
+    if total_count == 0:
+        return []
+    total_pages = math.ceil(total_count / query.page_size) if total_count else 0
+    metrics.histogram("fund_pages", "lsjz pages per fund fetch", buckets=COUNT_BUCKETS).observe(total_pages)
+    all_data: List[Dict[str, Any]] = []
+    all_data.extend(first_data.get("Data", {}).get("LSJZList") or [])
+    missing_pages: List[int] = []
+    page_errors: List[str] = []
+    if total_pages > 1:
+        pages = list(range(2, total_pages + 1))
+        tasks = [_fetch_nav_page(client, semaphore, query, page, s_date, e_date, raw_pages) for page in pages]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for page, result in zip(pages, results):
+            if isinstance(result, Exception):
+                missing_pages.append(page)
+                page_errors.append(str(result))
+                continue
+            all_data.extend(result.get("Data", {}).get("LSJZList") or [])
+    if archive is not None:
+        bodies = [raw_pages[page] for page in sorted(raw_pages)]
+        await asyncio.to_thread(archive.store_fetch, query.code, s_date, e_date, query.page_size, total_count, bodies, missing_pages)
+    if page_errors:
+        raise NavPartialError(all_data, missing_pages, page_errors)
+    if not all_data:
+        raise ValueError("No data found.")
+    return all_data
+
+async def get_fund_nav_data_from_api(query: FundNavQuery, client: Optional[httpx.AsyncClient] = None) -> FundNavResult:
+    all_data = await _collect_nav_list(query, client)
     records = [
         _model_validate(
             FundNavValue,
@@ -182,5 +358,5 @@ async def get_fund_nav_data_from_api(query: FundNavQuery) -> FundNavResult:
     ]
     return FundNavResult(data=records)
 
-async def get_fund_nav_raw_from_api(query: FundNavQuery) -> List[Dict[str, Any]]:
-    return await _collect_nav_list(query)
+async def get_fund_nav_raw_from_api(query: FundNavQuery, client: Optional[httpx.AsyncClient] = None) -> List[Dict[str, Any]]:
+    return await _collect_nav_list(query, client)
@@ -0,0 +1,175 @@
+import bisect
+import json
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels_text(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def samples(self, name: str, labels: Labels) -> Iterable[str]:
+        yield f"{name}{_labels_text(labels)} {_number(self.value)}"
+
+    def summary(self) -> dict:
+        return {"value": self.value}
+
+
+class Gauge:
+    """Last value plus the peak and mean of every value set, for depths sampled during the run."""
+
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0.0
+        self.max = 0.0
+        self._total = 0.0
+        self._samples = 0
+
+    def set(self, value: float) -> None:
+        self.value = value
+        self.max = max(self.max, value)
+        self._total += value
+        self._samples += 1
+
+    @property
+    def mean(self) -> float:
+        return self._total / self._samples if self._samples else 0.0
+
+    def samples(self, name: str, labels: Labels) -> Iterable[str]:
+        yield f"{name}{_labels_text(labels)} {_number(self.value)}"
+
+    def summary(self) -> dict:
+        return {"value": self.value, "max": self.max, "mean": self.mean}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the observed max for the overflow bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return self.max if bound == math.inf else bound
+        return self.max
+
+    def samples(self, name: str, labels: Labels) -> Iterable[str]:
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield f"{name}_bucket{_labels_text(labels, ('le', _number(bound)))} {cumulative}"
+        yield f"{name}_sum{_labels_text(labels)} {_number(self.sum)}"
+        yield f"{name}_count{_labels_text(labels)} {self.count}"
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """In-process metrics for one run, exported once at the end as Prometheus text or a JSON summary."""
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: Dict[str, Tuple[str, Dict[Labels, object]]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str, help_text: str, labels: Optional[Dict[str, str]], factory):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            _, series = self._metrics.setdefault(self.prefix + name, (help_text, {}))
+            metric = series.get(key)
+            if metric is None:
+                metric = series[key] = factory()
+        return metric
+
+    def counter(self, name: str, help_text: str = "", labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self._get(name, help_text, labels, Counter)
+
+    def gauge(self, name: str, help_text: str = "", labels: Optional[Dict[str, str]] = None) -> Gauge:
+        return self._get(name, help_text, labels, Gauge)
+
+    def histogram(self, name: str, help_text: str = "", labels: Optional[Dict[str, str]] = None,
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(name, help_text, labels, lambda: Histogram(buckets))
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+        for name, (help_text, series) in sorted(self._metrics.items()):
+            if not series:
+                continue
+            kind = next(iter(series.values())).kind
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in sorted(series.items()):
+                lines.extend(metric.samples(name, labels))
+                if kind == "gauge":
+                    lines.append(f"{name}_max{_labels_text(labels)} {_number(metric.max)}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> dict:
+        out = {}
+        for name, (_, series) in sorted(self._metrics.items()):
+            for labels, metric in sorted(series.items()):
+                out[name + _labels_text(labels)] = metric.summary()
+        return out
+
+    def write(self, path: str, fmt: str = "prometheus") -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            if fmt == "json":
+                json.dump(self.to_json(), f, ensure_ascii=False, indent=2)
+            else:
+                f.write(self.to_prometheus())
+
+
+metrics = MetricsRegistry(prefix="gob_nav_")
@@ -0,0 +1,238 @@
+import datetime
+import json
+import os
+import tempfile
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FIELDS = ("net_asset_value", "accumulated_asset_value")
+DTYPE = np.dtype("<f8")
+FORMAT_VERSION = 1
+# Date headroom added whenever the axis outgrows the files: about one year of trading days, so the full
+# rewrite happens roughly once a year and every other sync appends in place.
+DATE_HEADROOM = 256
+
+def _write_atomic(path: str, write) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class NavStore:
+    """Read-only view of a local NAV store written by NavStoreWriter.
+
+    Every field is one fund-major float64 matrix: row ``i`` is fund ``fund_ids[i]`` over the shared trading-date
+    axis ``dates``, NaN where the fund published nothing. All arrays are memory-mapped views, nothing is copied
+    until it is read. A store opened before a sync keeps seeing the state it was opened at.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        with open(os.path.join(root, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"不支持的存储版本: {self.meta['version']}")
+        gen = self.meta["generation"]
+        self.n_funds = self.meta["n_funds"]
+        self.n_dates = self.meta["n_dates"]
+        self.capacity = self.meta["date_capacity"]
+        self.fund_ids: np.ndarray = np.load(os.path.join(root, f"funds-{gen}.npy"), mmap_mode="r")[:self.n_funds]
+        days = np.load(os.path.join(root, f"dates-{gen}.npy"), mmap_mode="r")[:self.n_dates]
+        self.dates: np.ndarray = days.view("datetime64[D]")
+        self._fields: Dict[str, np.ndarray] = {}
+        for field in FIELDS:
+            path = os.path.join(root, f"{field}-{gen}.f8")
+            if self.n_funds:
+                matrix = np.memmap(path, dtype=DTYPE, mode="r", shape=(self.n_funds, self.capacity))
+            else:
+                matrix = np.empty((0, self.capacity), dtype=DTYPE)
+            self._fields[field] = matrix[:, :self.n_dates]
+        self._index: Optional[Dict[str, int]] = None
+
+    @property
+    def last_date(self) -> Optional[datetime.date]:
+        return self.dates[-1].item() if self.n_dates else None
+
+    @property
+    def net_asset_value(self) -> np.ndarray:
+        return self._fields["net_asset_value"]
+
+    @property
+    def accumulated_asset_value(self) -> np.ndarray:
+        return self._fields["accumulated_asset_value"]
+
+    def field(self, name: str) -> np.ndarray:
+        if name not in self._fields:
+            raise KeyError(f"未知字段: {name}，可选 {', '.join(FIELDS)}")
+        return self._fields[name]
+
+    def index(self, fund_id: str) -> int:
+        if self._index is None:
+            self._index = {str(fund): i for i, fund in enumerate(self.fund_ids)}
+        return self._index[fund_id]
+
+    def rows(self, fund_ids: Sequence[str]) -> np.ndarray:
+        return np.fromiter((self.index(fund) for fund in fund_ids), dtype=np.intp, count=len(fund_ids))
+
+    def date_slice(self, start: Optional[datetime.date] = None, end: Optional[datetime.date] = None) -> slice:
+        lo = int(np.searchsorted(self.dates, np.datetime64(start, "D"), "left")) if start else 0
+        hi = int(np.searchsorted(self.dates, np.datetime64(end, "D"), "right")) if end else self.n_dates
+        return slice(lo, hi)
+
+    def series(self, fund_id: str, field: str = "net_asset_value") -> np.ndarray:
+        return self.field(field)[self.index(fund_id)]
+
+    def window(self, start: Optional[datetime.date] = None, end: Optional[datetime.date] = None,
+               field: str = "net_asset_value") -> Tuple[np.ndarray, np.ndarray]:
+        """Dates in [start, end] and the (n_funds, n_days) matrix over them, both views into the store."""
+        cols = self.date_slice(start, end)
+        return self.dates[cols], self.field(field)[:, cols]
+
+
+class NavStoreWriter:
+    """Creates and appends to a NavStore directory.
+
+    ``meta.json`` is the commit point: data is written first, meta last, so a crashed sync leaves the previous
+    state readable. Funds are appended as new rows by extending the files in place; dates are appended into the
+    spare columns. Only when the date axis outgrows its capacity, or a date has to be inserted before the last
+    one, is a new generation of files written and the old one removed after the switch.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        meta_path = os.path.join(root, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+            gen = self.meta["generation"]
+            self.fund_ids: List[str] = [str(f) for f in np.load(os.path.join(root, f"funds-{gen}.npy"))[:self.meta["n_funds"]]]
+            self.days: np.ndarray = np.load(os.path.join(root, f"dates-{gen}.npy"))[:self.meta["n_dates"]].astype(np.int32)
+        else:
+            self.meta = {"version": FORMAT_VERSION, "generation": 0, "n_funds": 0, "n_dates": 0, "date_capacity": 0,
+                         "synced_at": None}
+            self.fund_ids = []
+            self.days = np.empty(0, dtype=np.int32)
+        self.index: Dict[str, int] = {fund: i for i, fund in enumerate(self.fund_ids)}
+        self._matrices: Dict[str, np.ndarray] = {}
+
+    @property
+    def exists(self) -> bool:
+        return self.meta["n_funds"] > 0 or self.meta["synced_at"] is not None
+
+    @property
+    def generation(self) -> int:
+        return self.meta["generation"]
+
+    def _field_path(self, field: str, gen: int) -> str:
+        return os.path.join(self.root, f"{field}-{gen}.f8")
+
+    def _open(self, gen: int, n_funds: int, capacity: int, keep_rows: int) -> None:
+        """Map every field of ``gen`` as (n_funds, capacity). Rows past ``keep_rows`` (including any left by a
+        sync that died before its commit) are reset to NaN."""
+        self.close()
+        row_bytes = capacity * DTYPE.itemsize
+        for field in FIELDS:
+            path = self._field_path(field, gen)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            have_rows = min(size // row_bytes if row_bytes else 0, keep_rows)
+            if have_rows < n_funds:
+                with open(path, "ab") as f:
+                    f.truncate(have_rows * row_bytes)
+                    nan_row = np.full(capacity, np.nan, dtype=DTYPE).tobytes()
+                    for _ in range(n_funds - have_rows):
+                        f.write(nan_row)
+            if n_funds and capacity:
+                self._matrices[field] = np.memmap(path, dtype=DTYPE, mode="r+", shape=(n_funds, capacity))
+            else:
+                self._matrices[field] = np.empty((n_funds, capacity), dtype=DTYPE)
+
+    def close(self) -> None:
+        for matrix in self._matrices.values():
+            if isinstance(matrix, np.memmap):
+                matrix.flush()
+        self._matrices = {}
+
+    def plan(self, fund_ids: Iterable[str], days: np.ndarray) -> bool:
+        """Extend the fund list and date axis; returns False when a date falls before the last one on the axis
+        and is not on it yet, which needs a rebuild."""
+        new_days = np.setdiff1d(np.unique(days), self.days)
+        if len(self.days) and len(new_days) and new_days[0] < self.days[-1]:
+            return False
+        new_funds = sorted(set(fund_ids) - self.index.keys())
+        for fund in new_funds:
+            self.index[fund] = len(self.fund_ids)
+            self.fund_ids.append(fund)
+        n_dates = len(self.days) + len(new_days)
+        old_gen, old_capacity, old_dates = self.generation, self.meta["date_capacity"], len(self.days)
+        self.days = np.concatenate([self.days, new_days.astype(np.int32)])
+        if n_dates > old_capacity or not self.exists:
+            self._regenerate(old_gen, old_capacity, old_dates, n_dates + DATE_HEADROOM)
+        else:
+            self._open(old_gen, len(self.fund_ids), old_capacity, self.meta["n_funds"])
+            for matrix in self._matrices.values():
+                matrix[:, old_dates:n_dates] = np.nan
+        return True
+
+    def _regenerate(self, old_gen: int, old_capacity: int, old_dates: int, capacity: int) -> None:
+        new_gen = old_gen + 1 if self.exists else old_gen
+        old_funds = self.meta["n_funds"]
+        old = {}
+        if self.exists and old_funds and old_capacity:
+            for field in FIELDS:
+                old[field] = np.memmap(self._field_path(field, old_gen), dtype=DTYPE, mode="r", shape=(old_funds, old_capacity))
+        for field in FIELDS:
+            path = self._field_path(field, new_gen)
+            if os.path.exists(path):
+                os.unlink(path)
+        self.meta["generation"] = new_gen
+        self.meta["date_capacity"] = capacity
+        self._open(new_gen, len(self.fund_ids), capacity, 0)
+        for field, matrix in old.items():
+            self._matrices[field][:old_funds, :old_dates] = matrix[:, :old_dates]
+
+    def reset(self) -> None:
+        """Drop all funds and dates; the next plan() writes a fresh generation."""
+        self.close()
+        self.meta.update({"generation": self.generation + 1, "n_funds": 0, "n_dates": 0, "date_capacity": 0})
+        self.meta["synced_at"] = None
+        self.fund_ids = []
+        self.days = np.empty(0, dtype=np.int32)
+        self.index = {}
+
+    def put(self, fund_ids: Sequence[str], days: np.ndarray, values: Dict[str, np.ndarray]) -> None:
+        rows = np.fromiter((self.index[fund] for fund in fund_ids), dtype=np.intp, count=len(fund_ids))
+        cols = np.searchsorted(self.days, days)
+        for field, column in values.items():
+            self._matrices[field][rows, cols] = column
+
+    def commit(self, synced_at: str, extra: Optional[dict] = None) -> None:
+        self.close()
+        gen = self.generation
+        funds = np.array(self.fund_ids, dtype=f"<U{max([len(f) for f in self.fund_ids] + [1])}")
+        _write_atomic(os.path.join(self.root, f"funds-{gen}.npy"), lambda f: np.save(f, funds))
+        _write_atomic(os.path.join(self.root, f"dates-{gen}.npy"), lambda f: np.save(f, self.days.astype(np.int64)))
+        self.meta.update({"n_funds": len(self.fund_ids), "n_dates": len(self.days), "synced_at": synced_at,
+                          "dtype": DTYPE.str, "fields": list(FIELDS)})
+        if extra:
+            self.meta.update(extra)
+        meta_bytes = json.dumps(self.meta, ensure_ascii=False, indent=2).encode("utf-8")
+        _write_atomic(os.path.join(self.root, "meta.json"), lambda f: f.write(meta_bytes))
+        self._remove_stale_generations()
+
+    def _remove_stale_generations(self) -> None:
+        suffix = f"-{self.generation}."
+        for name in os.listdir(self.root):
+            if name == "meta.json" or name.endswith(".tmp") or suffix in name:
+                continue
+            if name.startswith(tuple(f"{prefix}-" for prefix in FIELDS + ("funds", "dates"))):
+                os.unlink(os.path.join(self.root, name))
@@ -0,0 +1,142 @@
+import bisect
+import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+
+# Decisions; the first four are fetched, the rest skipped.
+NEW = "new"
+DUE = "due"
+LATE = "late"
+PROBE = "probe"
+WAITING = "waiting"
+BACKOFF = "backoff"
+DORMANT = "dormant"
+FETCH_DECISIONS = (NEW, DUE, LATE, PROBE)
+
+# A date counts as a trading day when at least this share of the busiest day's funds published on it.
+TRADING_DAY_MIN_SHARE = 0.2
+# Lag samples above this many trading days are treated as outages of our own job, not of the fund.
+MAX_OBSERVED_LAG = 10
+# Empty fetches kept per fund; enough to reach any sensible backoff cap (2 ** 7 days).
+EMPTY_CHECK_HISTORY = 8
+
+
+def _weekdays_after(start: datetime.date, end: datetime.date) -> int:
+    """Weekdays in (start, end]."""
+    days = (end - start).days
+    if days <= 0:
+        return 0
+    full_weeks, rest = divmod(days, 7)
+    count = full_weeks * 5
+    for i in range(1, rest + 1):
+        if (start + datetime.timedelta(days=i)).weekday() < 5:
+            count += 1
+    return count
+
+
+class TradingCalendar:
+    """Trading days observed in fund_nav_daily, extended with plain weekdays after the last observed one."""
+
+    def __init__(self, days: Iterable[datetime.date]):
+        self.days: List[datetime.date] = sorted(set(days))
+        self._positions: Dict[datetime.date, int] = {d: i + 1 for i, d in enumerate(self.days)}
+
+    @classmethod
+    def from_counts(cls, counts: Dict[datetime.date, int], min_share: float = TRADING_DAY_MIN_SHARE) -> "TradingCalendar":
+        if not counts:
+            return cls([])
+        threshold = max(counts.values()) * min_share
+        return cls(d for d, n in counts.items() if n >= threshold)
+
+    def position(self, day: datetime.date) -> int:
+        """Number of trading days up to and including ``day``."""
+        known = self._positions.get(day)
+        if known is not None:
+            return known
+        if not self.days or day <= self.days[-1]:
+            return bisect.bisect_right(self.days, day)
+        return len(self.days) + _weekdays_after(self.days[-1], day)
+
+    def gap(self, start: datetime.date, end: datetime.date) -> int:
+        """Trading days in (start, end]."""
+        return self.position(end) - self.position(start)
+
+    def shift(self, day: datetime.date, n: int) -> datetime.date:
+        """The n-th trading day after ``day`` (``day`` itself when n is 0)."""
+        if n <= 0:
+            return day
+        target = self.position(day) + n
+        if target <= len(self.days):
+            return self.days[target - 1]
+        d = max(day, self.days[-1]) if self.days else day
+        remaining = target - self.position(d)
+        while remaining > 0:
+            d += datetime.timedelta(days=1)
+            if d.weekday() < 5:
+                remaining -= 1
+        return d
+
+
+class FundCadence(BaseModel):
+    fund_id: str
+    watermark: Optional[datetime.date] = None
+    # Trading days between consecutive NAVs, and trading days from a NAV date until it can be fetched.
+    cadence: int = 1
+    lag: int = 0
+    # Dates of the most recent fetches after the watermark that came back empty.
+    empty_checks: List[datetime.date] = []
+
+
+def _percentile(values: Sequence[int], q: float) -> int:
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def infer_cadence(calendar: TradingCalendar, nav_dates: Sequence[datetime.date], min_gaps: int = 3) -> int:
+    gaps = [g for g in (calendar.gap(a, b) for a, b in zip(nav_dates, nav_dates[1:])) if g > 0]
+    if len(gaps) < min_gaps:
+        return 1
+    return max(1, _percentile(gaps, 0.5))
+
+
+def infer_lag(calendar: TradingCalendar, nav_dates: Sequence[datetime.date], stored_dates: Sequence[datetime.date],
+              min_samples: int = 3) -> int:
+    """How many trading days after its date a NAV usually becomes available.
+
+    Each day something was stored yields one sample: the newest NAV stored that day, which was the newest one
+    available then. Older rows stored alongside it are backfill and say nothing about the lag.
+    """
+    newest: Dict[datetime.date, datetime.date] = {}
+    for nav_date, stored in zip(nav_dates, stored_dates):
+        if stored not in newest or nav_date > newest[stored]:
+            newest[stored] = nav_date
+    lags = [lag for lag in (calendar.gap(n, s) for s, n in newest.items()) if 0 <= lag <= MAX_OBSERVED_LAG]
+    if len(lags) < min_samples:
+        return 0
+    return _percentile(lags, 0.8)
+
+
+def decide(fund: FundCadence, calendar: TradingCalendar, run_date: datetime.date, max_backoff_days: int,
+           dormant_days: int) -> Tuple[str, Optional[datetime.date]]:
+    """Decision for one fund on ``run_date`` and the earliest date it is worth fetching again."""
+    if fund.watermark is None:
+        # Never published anything: every empty fetch counts.
+        available = datetime.date.min
+        dormant = False
+    else:
+        expected = calendar.shift(fund.watermark, fund.cadence)
+        available = calendar.shift(expected, fund.lag)
+        if run_date < available:
+            return WAITING, available
+        dormant = (run_date - fund.watermark).days > dormant_days
+    # Empty fetches before the NAV could have been out say nothing about this fund being late.
+    late_checks = [d for d in fund.empty_checks if d >= available]
+    if not late_checks:
+        return (NEW if fund.watermark is None else PROBE if dormant else DUE), run_date
+    # Retry after 1, 2, 4, ... days; dormant funds only at the cap.
+    wait = max_backoff_days if dormant else min(2 ** (len(late_checks) - 1), max_backoff_days)
+    next_check = max(late_checks) + datetime.timedelta(days=wait)
+    if run_date >= next_check:
+        return (NEW if fund.watermark is None else PROBE if dormant else LATE), run_date
+    return (DORMANT if dormant else BACKOFF), next_check
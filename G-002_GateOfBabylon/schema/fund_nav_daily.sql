@@ -6,7 +6,38 @@ CREATE TABLE IF NOT EXISTS public.fund_nav_daily (
   _create_timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   _update_timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   PRIMARY KEY (fund_id, nav_date)
-);
+) PARTITION BY RANGE (nav_date);
+
+CREATE INDEX IF NOT EXISTS fund_nav_daily_nav_date_brin ON public.fund_nav_daily USING BRIN (nav_date);
+-- Incremental exports select rows by _update_timestamp; rows are written roughly in time order, so BRIN fits.
+CREATE INDEX IF NOT EXISTS fund_nav_daily_update_ts_brin ON public.fund_nav_daily USING BRIN (_update_timestamp);
+
+CREATE OR REPLACE FUNCTION public.ensure_fund_nav_daily_partitions(from_date DATE, to_date DATE)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  y INTEGER;
+  part_name TEXT;
+  created INTEGER := 0;
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'public.fund_nav_daily'::regclass) THEN
+    RETURN 0;
+  END IF;
+  PERFORM pg_advisory_xact_lock(hashtext('public.fund_nav_daily partitions'));
+  FOR y IN EXTRACT(YEAR FROM from_date)::INTEGER .. EXTRACT(YEAR FROM to_date)::INTEGER LOOP
+    part_name := format('fund_nav_daily_%s', y);
+    IF to_regclass(format('public.%I', part_name)) IS NULL THEN
+      EXECUTE format(
+        'CREATE TABLE public.%I PARTITION OF public.fund_nav_daily FOR VALUES FROM (%L) TO (%L)',
+        part_name, make_date(y, 1, 1), make_date(y + 1, 1, 1)
+      );
+      created := created + 1;
+    END IF;
+  END LOOP;
+  RETURN created;
+END;
+$$;
 
 CREATE OR REPLACE FUNCTION public.set_fund_nav_daily_updated_timestamp()
 RETURNS TRIGGER
@@ -0,0 +1,49 @@
+CREATE TABLE IF NOT EXISTS public.fund_nav_job (
+  job_id BIGSERIAL PRIMARY KEY,
+  start_date DATE NOT NULL,
+  end_date DATE NOT NULL,
+  incremental BOOLEAN NOT NULL DEFAULT FALSE,
+  status VARCHAR(16) NOT NULL DEFAULT 'running',
+  total_funds INTEGER NOT NULL DEFAULT 0,
+  _create_timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  _update_timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS public.fund_nav_job_item (
+  job_id BIGINT NOT NULL REFERENCES public.fund_nav_job (job_id) ON DELETE CASCADE,
+  fund_id VARCHAR(16) NOT NULL,
+  fund_start DATE NOT NULL,
+  status VARCHAR(16) NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  last_error TEXT,
+  covered_start DATE,
+  covered_end DATE,
+  rows_fetched INTEGER,
+  _create_timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  _update_timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (job_id, fund_id)
+);
+
+CREATE INDEX IF NOT EXISTS fund_nav_job_item_status_idx ON public.fund_nav_job_item (job_id, status);
+
+CREATE OR REPLACE FUNCTION public.set_fund_nav_job_updated_timestamp()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW._update_timestamp := NOW();
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS fund_nav_job_set_updated ON public.fund_nav_job;
+CREATE TRIGGER fund_nav_job_set_updated
+BEFORE UPDATE ON public.fund_nav_job
+FOR EACH ROW
+EXECUTE FUNCTION public.set_fund_nav_job_updated_timestamp();
+
+DROP TRIGGER IF EXISTS fund_nav_job_item_set_updated ON public.fund_nav_job_item;
+CREATE TRIGGER fund_nav_job_item_set_updated
+BEFORE UPDATE ON public.fund_nav_job_item
+FOR EACH ROW
+EXECUTE FUNCTION public.set_fund_nav_job_updated_timestamp();